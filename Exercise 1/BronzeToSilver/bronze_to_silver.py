@@ -0,0 +1,187 @@
+import pandas as pd
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# The storage layer lives one directory up, next to the Bronze, Silver and Gold folders
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The instrumentation is shared by every exercise and lives at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from storage import ChunkWriter, table_path, write_table
+from instrumentation import file_size, peak_rss_mb, span
+from swiggy_stream import stream_restaurants
+
+# Get the directory path where the script is executing
+script_path = os.path.dirname(os.path.abspath(__file__))
+
+# Folder that holds the Bronze and Silver folders
+BASE_DIR = os.path.dirname(script_path)
+
+# Declaration of every Bronze -> Silver dataset. Onboarding a new dataset means adding an entry here.
+#   'source'       - file name inside Bronze
+#   'format'       - 'csv', 'json', or 'swiggy_json' for the city -> restaurants document of Swiggy,
+#                    which is streamed and flattened to one row per restaurant (see swiggy_stream.py)
+#   'drop_columns' - columns deleted on the way to Silver
+#   'skip_cities'  - swiggy_json only: cities left out of Silver
+#   'null_policy'  - 'drop' removes rows with a null in any column, 'keep' keeps them,
+#                    a dict of column -> value fills the nulls of those columns instead
+#   'target'       - table name inside Silver, the extension comes from the storage format
+#   'chunk_size'   - CSV and swiggy_json: read and write the file in chunks of this many rows so memory
+#                    stays bounded by the chunk size, None loads a CSV file at once
+DATASETS = {
+    'iowa': {
+        'source': "Iowa_Liquor_Sales.csv",
+        'format': 'csv',
+        'drop_columns': ['Pack'],
+        'null_policy': 'drop',
+        'target': "Iowa_Liquor_Sales",
+        'chunk_size': 500_000,
+    },
+    'amazon': {
+        'source': "amazon-fine-food-reviews.csv",
+        'format': 'csv',
+        'drop_columns': ['Text'],
+        'null_policy': 'drop',
+        'target': "amazon-fine-food-reviews",
+        'chunk_size': 500_000,
+    },
+    'swiggy': {
+        'source': "swiggy-restaurants-dataset.json",
+        'format': 'swiggy_json',
+        'skip_cities': ['Wardha', 'Washim', 'Wayanad'],
+        'drop_columns': [],
+        'null_policy': 'drop',
+        'target': "swiggy-restaurants-dataset",
+        'chunk_size': 50_000,
+    },
+}
+
+
+# Delete the columns of the spec and apply its null policy
+def transform(data, spec):
+    data = data.drop(columns=spec['drop_columns'])
+
+    null_policy = spec['null_policy']
+    if null_policy == 'drop':
+        return data.dropna()
+    if null_policy == 'keep':
+        return data
+    return data.fillna(null_policy)
+
+
+# Read the whole source file, transform it and save it in one go
+def convert_in_memory(source_path, target_path, spec):
+    if spec['format'] == 'csv':
+        data = pd.read_csv(source_path)
+    else:
+        data = pd.read_json(source_path)
+    rows_in = len(data)
+
+    data = transform(data, spec)
+    write_table(data, target_path)
+    return rows_in, len(data)
+
+
+# Read the CSV file chunk by chunk and append every transformed chunk to the Silver table.
+# The column drop and the null policy work row by row, so the result is the same as convert_in_memory.
+def convert_streaming(source_path, target_path, spec):
+    rows_in = 0
+    rows_out = 0
+
+    with ChunkWriter(target_path) as writer:
+        for chunk in pd.read_csv(source_path, chunksize=spec['chunk_size']):
+            rows_in += len(chunk)
+            chunk = transform(chunk, spec)
+            rows_out += len(chunk)
+            writer.write(chunk)
+
+    return rows_in, rows_out
+
+
+# Stream the Swiggy document restaurant by restaurant and append them to the Silver table in chunks.
+# The city and column filters are applied while streaming, the null policy on every chunk.
+def convert_swiggy_streaming(source_path, target_path, spec):
+    rows_in = 0
+    rows_out = 0
+    columns = None
+    records = stream_restaurants(source_path, spec.get('skip_cities', ()), spec['drop_columns'])
+
+    with ChunkWriter(target_path) as writer:
+        while True:
+            batch = [record for _, record in zip(range(spec['chunk_size']), records)]
+            if not batch:
+                break
+
+            # The first chunk fixes the columns of the table
+            chunk = pd.DataFrame(batch, columns=columns)
+            columns = list(chunk.columns)
+
+            rows_in += len(chunk)
+            chunk = transform(chunk, {**spec, 'drop_columns': []})
+            rows_out += len(chunk)
+            writer.write(chunk)
+
+    return rows_in, rows_out
+
+
+# Move one dataset from Bronze to Silver and measure it
+def run_dataset(name, spec, base_dir=BASE_DIR):
+    source_path = os.path.join(base_dir, "Bronze", spec['source'])
+    target_path = table_path(os.path.join(base_dir, "Silver"), spec['target'], spec.get('target_format'))
+
+    with span("bronze_to_silver", dataset=name) as stage:
+        start = time.perf_counter()
+        if spec['format'] == 'swiggy_json':
+            rows_in, rows_out = convert_swiggy_streaming(source_path, target_path, spec)
+        elif spec['format'] == 'csv' and spec.get('chunk_size'):
+            rows_in, rows_out = convert_streaming(source_path, target_path, spec)
+        else:
+            rows_in, rows_out = convert_in_memory(source_path, target_path, spec)
+        duration = time.perf_counter() - start
+
+        stage.rows_in = rows_in
+        stage.rows_out = rows_out
+        stage.bytes_read = file_size(source_path)
+        stage.bytes_written = file_size(target_path)
+
+    return {
+        'dataset': name,
+        'target': target_path,
+        'duration': duration,
+        'rows_in': rows_in,
+        'rows_out': rows_out,
+        'rows_per_second': rows_in / duration if duration > 0 else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+# Run the given datasets (all of them by default), several at a time in a process pool
+def run_datasets(names=None, base_dir=BASE_DIR, workers=None, datasets=DATASETS):
+    names = names or list(datasets)
+
+    if len(names) == 1:
+        results = [run_dataset(names[0], datasets[names[0]], base_dir)]
+    else:
+        # A fresh process per dataset (Python 3.11+): the peak memory of a worker covers every task it ran,
+        # so a reused worker would charge a dataset with the peak of an earlier one
+        with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as pool:
+            futures = [pool.submit(run_dataset, name, datasets[name], base_dir) for name in names]
+            results = [future.result() for future in futures]
+
+    print_results(results)
+    return results
+
+
+# Print duration, row counts and throughput of every dataset
+def print_results(results):
+    print(f"{'Dataset':<10} {'Duration':>10} {'Rows in':>12} {'Rows out':>12} {'Rows/s':>12} {'Peak RSS':>10}")
+    for result in results:
+        print(f"{result['dataset']:<10} {result['duration']:>9.2f}s {result['rows_in']:>12} {result['rows_out']:>12} "
+              f"{result['rows_per_second']:>12.0f} {result['peak_rss_mb']:>7.1f} MB")
+        print("  ->", result['target'])
+
+
+if __name__ == "__main__":
+    # Move every dataset from Bronze to Silver, or only the ones named on the command line
+    run_datasets(sys.argv[1:] or None)
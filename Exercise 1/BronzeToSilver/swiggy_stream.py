@@ -0,0 +1,134 @@
+import json
+
+# Streaming reader for the Swiggy restaurants document.
+#
+# The Bronze file is one JSON object keyed by city:
+#   {"Abohar": {"link": "...", "restaurants": {"<id>": {"name": ..., "rating": ..., "menu": {...}}, ...}}, ...}
+# Instead of loading the whole document, the file is read in blocks and walked with a small scanner.
+# Only one restaurant is decoded at a time, so memory stays flat regardless of the file size.
+BLOCK_SIZE = 1024 * 1024
+
+WHITESPACE = ' \t\n\r'
+
+
+class JsonScanner:
+    def __init__(self, file, block_size=BLOCK_SIZE):
+        self.file = file
+        self.block_size = block_size
+        self.buffer = ''
+        self.position = 0
+        self.decoder = json.JSONDecoder()
+
+    # Read the next block into the buffer, dropping what was already consumed. False at end of file.
+    def fill(self):
+        block = self.file.read(self.block_size)
+        if not block:
+            return False
+        self.buffer = self.buffer[self.position:] + block
+        self.position = 0
+        return True
+
+    # Next character that is not whitespace, without consuming it ('' at end of file)
+    def peek(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                return ''
+
+    def expect(self, character):
+        found = self.peek()
+        if found != character:
+            raise ValueError(f"Expected {character!r} in the JSON document but found {found!r}")
+        self.position += 1
+
+    # Decode one complete JSON value (a string, a number, an object...) starting at the current position
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                # The value continues in the next block
+                if not self.fill():
+                    raise
+                continue
+            # A number that ends with the buffer may continue in the next block
+            if end == len(self.buffer) and not isinstance(value, (dict, list, str)) and self.fill():
+                continue
+            self.position = end
+            return value
+
+    # Step over the value at the current position without building it, objects and arrays are walked
+    def skip(self):
+        character = self.peek()
+        if character == '{':
+            for _ in self.members():
+                self.skip()
+        elif character == '[':
+            self.position += 1
+            if self.peek() == ']':
+                self.position += 1
+                return
+            while True:
+                self.skip()
+                if self.peek() == ',':
+                    self.position += 1
+                    continue
+                self.expect(']')
+                return
+        else:
+            self.value()
+
+    # Walk an object one member at a time: yields each key and leaves the scanner on its value,
+    # the caller must consume the value (with value() or by walking it) before asking for the next key
+    def members(self):
+        self.expect('{')
+        if self.peek() == '}':
+            self.position += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.position += 1
+                continue
+            self.expect('}')
+            return
+
+
+# Yield one flat record per restaurant: the city, the restaurant id and the restaurant's own fields.
+# Cities in skip_cities are walked past without decoding their restaurants, columns in drop_columns are
+# left out of the records, and nested fields (the menu) are not part of the tabular record.
+def stream_restaurants(path, skip_cities=(), drop_columns=(), block_size=BLOCK_SIZE):
+    skip_cities = set(skip_cities)
+    drop_columns = set(drop_columns)
+
+    with open(path, 'r', encoding='utf-8') as file:
+        scanner = JsonScanner(file, block_size)
+        for city in scanner.members():
+            if city in skip_cities or scanner.peek() != '{':
+                scanner.skip()
+                continue
+
+            # The city link comes before the restaurants in the Bronze file
+            city_link = None
+            for key in scanner.members():
+                if key != 'restaurants' or scanner.peek() != '{':
+                    value = scanner.value()
+                    if key == 'link':
+                        city_link = value
+                    continue
+
+                for restaurant_id in scanner.members():
+                    restaurant = scanner.value()
+                    record = {'city': city, 'city_link': city_link, 'restaurant_id': restaurant_id}
+                    for column, value in restaurant.items():
+                        if not isinstance(value, (dict, list)):
+                            record[column] = value
+                    for column in drop_columns:
+                        record.pop(column, None)
+                    yield record
@@ -1,183 +1,367 @@
 import pandas as pd
+import numpy as np
 import os
+import sys
+import time
+
+# The storage layer lives one directory up, next to the Bronze, Silver and Gold folders
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The instrumentation is shared by every exercise and lives at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from instrumentation import file_size, span
+from storage import read_table, read_table_chunks, table_path, write_table
+from gold_engine import print_timings, run_reports
+from gold_state import load_state, save_state
+from out_of_core import run_reports_out_of_core
+from heavy_hitters import refresh_top_k, validate_top_k
+from time_dimension import add_time_dimension
+
+# Incremental mode only folds the Silver rows newer than the last run into the saved aggregate state
+# (Gold/_state) and rewrites the Gold tables from it, instead of rescanning the whole review history.
+# The first incremental run, or a run with INCREMENTAL = False, does a full rebuild.
+INCREMENTAL = True
+
+# Out-of-core mode for Silver files larger than memory: the full rebuild hash-partitions the reviews on
+# ProductId and on UserId into spill files and aggregates one partition at a time (see out_of_core.py).
+# MEMORY_BUDGET_MB caps the rows held in memory, OUT_OF_CORE_WORKERS > 1 aggregates partitions in parallel
+# (the budget is then shared between the workers, so partitions get smaller and more numerous).
+OUT_OF_CORE = False
+MEMORY_BUDGET_MB = 1024
+OUT_OF_CORE_WORKERS = None
+PARTITION_KEYS = ['ProductId', 'UserId']
+
+# Streaming top-K of reviewers and products by number of reviews (amazon-top-reviewers-topk and
+# amazon-top-products-topk). Space-Saving sketches of TOP_K_CAPACITY keys are kept in Gold/_state and only
+# the new Silver rows are folded into them, in constant memory. VALIDATE_TOP_K compares them with exact counts.
+TOP_K = 10
+TOP_K_CAPACITY = 1000
+VALIDATE_TOP_K = False
+
+# Print how much memory the typed load profile below saves compared to a plain load of the Silver file
+MEMORY_REPORT = False
+
+# Typed load profile of the Silver reviews. Only the columns some Gold report reads are loaded
+# (ProfileName and Summary are not, Id tells apart the reviews of the watermark day between incremental runs),
+# the IDs are dictionary-encoded as categories and the counters get the narrowest integer type that holds them.
+# Time is in epoch seconds, uint32 lasts until 2106.
+SILVER_COLUMNS = ['Id', 'ProductId', 'UserId', 'HelpfulnessNumerator', 'HelpfulnessDenominator', 'Score', 'Time']
+SILVER_DTYPES = {
+    'Id': 'uint32',
+    'ProductId': 'category',
+    'UserId': 'category',
+    'HelpfulnessNumerator': 'int32',
+    'HelpfulnessDenominator': 'int32',
+    'Score': 'int8',
+    'Time': 'uint32',
+}
 
 # Get the directory path where the script is executing
 script_path = os.path.dirname(os.path.abspath(__file__))
 
 # Move up one directory and specify the relative path to the target file
-target_file_path = os.path.join(os.path.dirname(script_path), "Silver", "amazon-fine-food-reviews.csv")
+target_file_path = table_path(os.path.join(os.path.dirname(script_path), "Silver"), "amazon-fine-food-reviews")
+gold_path = os.path.join(os.path.dirname(script_path), "Gold")
+
+
+# Load the Silver reviews with the typed load profile
+def load_silver(silver_file, columns=SILVER_COLUMNS, filters=None):
+    return read_table(silver_file, columns=columns, filters=filters, dtypes=SILVER_DTYPES)
+
+
+# Load the Silver reviews not folded into the state yet: the ones after the watermark Time, and the ones of the
+# watermark Time whose Id is not in the watermark
+def load_new_reviews(silver_file, watermark):
+    data = load_silver(silver_file, filters=[('Time', '>=', watermark['Time'])])
+    folded = (data['Time'] == watermark['Time']) & data['Id'].isin(watermark['boundary_ids'])
+    return data[~folded].reset_index(drop=True)
+
+
+# Ids of the reviews of the new watermark Time folded into the state. reviews holds the Id and Time of the
+# reviews of this run (None for a full run that did not keep them), the ones folded before are added when
+# the watermark stays on the same Time.
+def watermark_ids(silver_file, reviews, new_watermark, watermark):
+    if reviews is None:
+        reviews = load_silver(silver_file, columns=['Id', 'Time'], filters=[('Time', '==', int(new_watermark))])
+    ids = set(reviews.loc[reviews['Time'] == new_watermark, 'Id'].tolist())
+    if watermark is not None and new_watermark == watermark['Time']:
+        ids |= set(watermark['boundary_ids'])
+    return ids
+
 
-print("Path of the file is :", target_file_path)
+# Load the Silver reviews in chunks of chunk_rows rows with the typed load profile
+def load_silver_chunks(silver_file, chunk_rows):
+    return read_table_chunks(silver_file, chunk_rows, columns=SILVER_COLUMNS, dtypes=SILVER_DTYPES)
 
-# Load your CSV file
-data = pd.read_csv(target_file_path)
+
+# Compare the resident memory of a plain load of the whole Silver file with the typed load profile
+def memory_report(silver_file):
+    plain = read_table(silver_file)
+    plain_bytes = plain.memory_usage(deep=True).sum()
+    del plain
+
+    typed = load_silver(silver_file)
+    typed_bytes = typed.memory_usage(deep=True).sum()
+
+    print(f"Plain load: {plain_bytes / 1024 ** 2:.1f} MB, typed load: {typed_bytes / 1024 ** 2:.1f} MB "
+          f"({plain_bytes / typed_bytes:.1f}x smaller)")
+    for column in typed.columns:
+        print(f"  {column:<25} {str(typed[column].dtype):<10} {typed[column].memory_usage(deep=True) / 1024 ** 2:>8.1f} MB")
+    return plain_bytes, typed_bytes
+
+
+# Every report below gets the result of the groupby on its 'keys' (grouped) and the Silver data (df),
+# and returns the Gold tables it produces. Reports with the same keys share one groupby, see gold_engine.py.
+# The groupby only holds counts and sums (score_count, score_sum, score_squared_sum, ...) so it can be
+# merged between incremental runs, the averages and standard deviations are derived from them here.
+
+# Derive the columns the aggregates read: the time dimension (Year, Month, Date) of every review,
+# computed once from the epoch seconds in Time, and the squared score for the std
+def prepare(df):
+    df = add_time_dimension(df)
+    df['score_squared'] = df['Score'] ** 2
+    return df
+
+
+# Average score from the score count and sum
+def average(grouped):
+    return grouped['score_sum'] / grouped['score_count']
+
+
+# Sample standard deviation of the score (as pandas std) from the score count, sum and sum of squares
+def standard_deviation(grouped):
+    count = grouped['score_count']
+    variance = (grouped['score_squared_sum'] - grouped['score_sum'] ** 2 / count) / (count - 1)
+    return np.sqrt(variance.clip(lower=0))
 
 
 # 1. Product-Level Analysis
 # Function to find the highest and lowest-rated products based on average score
-def top_low_rated_products(df):
-    # Ensure 'Time' column is converted to datetime to extract the year
-    df['Year'] = pd.to_datetime(df['Time']).dt.year
+def top_low_rated_products(grouped, df):
+    # Average score for each product by year
+    avg_scores = grouped[['ProductId', 'Year']].assign(Score=average(grouped))
 
-    # Calculate average score for each product by year
-    avg_scores = df.groupby(['ProductId', 'Year'])['Score'].mean().reset_index()
-    
     # Find top 10 highest and lowest-rated products
-    top_rated = avg_scores.nlargest(10, 'Score')
-    low_rated = avg_scores.nsmallest(10, 'Score')
-    
-    # Save the results
-    target_file_path = os.path.join(os.path.dirname(script_path), "Gold", "amazon-top-rated-products.csv")
-    top_rated.to_csv(target_file_path, index=False)
-
-    
-    target_file_path = os.path.join(os.path.dirname(script_path), "Gold", "amazon-low-rated-products.csv")
-    low_rated.to_csv(target_file_path, index=False)
-
-# Function to compare products with the most reviews to their average scores
-def popularity_vs_satisfaction(df):
-    # Count number of reviews and calculate average score per product
-    product_reviews = df.groupby('ProductId').agg(
-        num_reviews=('Score', 'size'),
-        avg_score=('Score', 'mean')
-    ).reset_index()
-    
-    # Merge the average score back with the original DataFrame to keep Score column
-    product_reviews = product_reviews.merge(df[['ProductId', 'Score']], on='ProductId', how='left')
+    return {
+        "amazon-top-rated-products": avg_scores.nlargest(10, 'Score'),
+        "amazon-low-rated-products": avg_scores.nsmallest(10, 'Score'),
+    }
 
+# Function to compare products with the most reviews to their average scores.
+# One row per product with its number of reviews, average score and how many reviews gave each score
+# from 1 to 5 (score_1 ... score_5), so the table grows with the number of products, not of reviews.
+def popularity_vs_satisfaction(grouped, df):
+    # Turn the review count per product and score into a fixed 1-5 score histogram per product
+    histogram = grouped.pivot(index='ProductId', columns='Score', values='score_count')
+    histogram = histogram.reindex(columns=SCORES).fillna(0).astype('int64')
+    histogram.columns = [f'score_{score}' for score in SCORES]
+
+    # Count number of reviews and calculate average score per product from the histogram
+    num_reviews = histogram.sum(axis=1)
+    product_reviews = pd.DataFrame({
+        'num_reviews': num_reviews,
+        'avg_score': histogram.to_numpy().dot(SCORES) / num_reviews,
+    }).join(histogram).reset_index()
 
     # Sort by number of reviews to see if highly reviewed products also have high ratings
     popular_products = product_reviews.sort_values(by='num_reviews', ascending=False)
-    
-    # Save the result
-    target_file_path = os.path.join(os.path.dirname(script_path), "Gold", "amazon-popularity-vs-satisfaction.csv")
-    popular_products.to_csv(target_file_path, index=False)
+    return {"amazon-popularity-vs-satisfaction": popular_products}
 
 # Function to analyze if product ratings have changed over time
-def product_improvements_over_time(df):
-    # Convert 'Time' column to datetime
-    df['Time'] = pd.to_datetime(df['Time'], unit='s')
-    
-    # Group by product and year, then calculate average rating per year
-    df['Year'] = df['Time'].dt.year
-    yearly_avg_score = df.groupby(['ProductId', 'Year'])['Score'].mean().reset_index()
-    
-    # Save the result
-    target_file_path = os.path.join(os.path.dirname(script_path), "Gold", "amazon-product-improvements-over-time.csv")
-    yearly_avg_score.to_csv(target_file_path, index=False)
+def product_improvements_over_time(grouped, df):
+    # Average rating per product and year
+    yearly_avg_score = grouped[['ProductId', 'Year']].assign(Score=average(grouped))
+    return {"amazon-product-improvements-over-time": yearly_avg_score}
 
 # 2. Reviewer Behavior and User Engagement
 
 # Function to identify top reviewers and analyze their average rating
-def top_reviewers(df):
+def top_reviewers(grouped, df):
     # Count reviews per user and calculate their average rating
-    user_reviews = df.groupby('UserId').agg(
-        num_reviews=('Score', 'size'),
-        avg_score=('Score', 'mean')
-    ).reset_index()
-    
+    user_reviews = grouped[['UserId']].assign(num_reviews=grouped['score_count'], avg_score=average(grouped))
+
     # Sort by number of reviews to identify top reviewers
     top_users = user_reviews.sort_values(by='num_reviews', ascending=False)
-    
-    # Save the result
-    target_file_path = os.path.join(os.path.dirname(script_path), "Gold", "amazon-top-reviewers.csv")
-    top_users.to_csv(target_file_path, index=False)
+    return {"amazon-top-reviewers": top_users}
 
 # Function to analyze helpfulness voting patterns of users
-def helpfulness_voting_patterns(df):
-    # Calculate total helpful votes per user
-    user_helpfulness = df.groupby('UserId').agg(
-        total_helpfulness_numerator=('HelpfulnessNumerator', 'sum'),
-        total_helpfulness_denominator=('HelpfulnessDenominator', 'sum')
-    ).reset_index()
-    
+def helpfulness_voting_patterns(grouped, df):
+    user_helpfulness = grouped[['UserId', 'total_helpfulness_numerator', 'total_helpfulness_denominator']].copy()
+
     # Add helpfulness ratio
     user_helpfulness['helpfulness_ratio'] = (
         user_helpfulness['total_helpfulness_numerator'] / user_helpfulness['total_helpfulness_denominator']
     )
-    
-    # Save the result
-    target_file_path = os.path.join(os.path.dirname(script_path), "Gold", "amazon-helpfulness-voting-patterns.csv")
-    user_helpfulness.to_csv(target_file_path, index=False)
+    return {"amazon-helpfulness-voting-patterns": user_helpfulness}
 
 # 3. Helpfulness Analysis of Reviews
 
 # Function to calculate helpfulness ratio and analyze factors contributing to high helpfulness
-def helpfulness_ratio_analysis(df):
-    # Calculate helpfulness ratio for each review
-    df['helpfulness_ratio'] = df['HelpfulnessNumerator'] / df['HelpfulnessDenominator']
-    
+def helpfulness_ratio_analysis(grouped, df):
     # Drop rows where denominator is zero to avoid division errors
-    helpful_reviews = df[df['HelpfulnessDenominator'] > 0]
-    
-    # Save the result
-    target_file_path = os.path.join(os.path.dirname(script_path), "Gold", "amazon-helpfulness-ratio-analysis.csv")
-    helpful_reviews.to_csv(target_file_path, index=False)
+    helpful_reviews = df[df['HelpfulnessDenominator'] > 0].drop(columns=['score_squared'])
+
+    # Calculate helpfulness ratio for each review
+    helpful_reviews = helpful_reviews.assign(
+        helpfulness_ratio=helpful_reviews['HelpfulnessNumerator'] / helpful_reviews['HelpfulnessDenominator']
+    )
+    return {"amazon-helpfulness-ratio-analysis": helpful_reviews}
 
 # 4. Temporal Analysis
 
 # Function to analyze trends in review volume and scores over time
-def trend_analysis_over_time(df):
-    # Convert 'Time' to datetime
-    df['Time'] = pd.to_datetime(df['Time'], unit='s')
-    
-    # Group by year and calculate the number of reviews and average score per year
-    df['Year'] = df['Time'].dt.year
-    yearly_trends = df.groupby('Year').agg(
-        num_reviews=('Score', 'size'),
-        avg_score=('Score', 'mean')
-    ).reset_index()
-    
-    # Save the result
-    target_file_path = os.path.join(os.path.dirname(script_path), "Gold", "amazon-trend-analysis-over-time.csv")
-    yearly_trends.to_csv(target_file_path, index=False)
+def trend_analysis_over_time(grouped, df):
+    # Number of reviews and average score per year
+    yearly_trends = grouped[['Year']].assign(num_reviews=grouped['score_count'], avg_score=average(grouped))
+    return {"amazon-trend-analysis-over-time": yearly_trends}
 
 # Function to identify seasonal popularity of products
-def seasonal_popularity(df):
-    # Convert 'Time' to datetime
-    df['Time'] = pd.to_datetime(df['Time'], unit='s')
-    
-    # Group by month and calculate number of reviews per month
-    df['Month'] = df['Time'].dt.month
-    monthly_trends = df.groupby('Month').size().reset_index(name='num_reviews')
-    
-    # Save the result
-    target_file_path = os.path.join(os.path.dirname(script_path), "Gold", "amazon-seasonal-popularity.csv")
-    monthly_trends.to_csv(target_file_path, index=False)
+def seasonal_popularity(grouped, df):
+    # Number of reviews per month
+    monthly_trends = grouped[['Month']].assign(num_reviews=grouped['score_count'])
+    return {"amazon-seasonal-popularity": monthly_trends}
 
 # 5. Exploring Anomalies and Biases
 
 # Function to detect anomalies in ratings
-def detect_rating_anomalies(df):
-    # Group by ProductId to find mean and standard deviation of scores for each product
-    product_stats = df.groupby('ProductId')['Score'].agg(['mean', 'std']).reset_index()
-    product_stats = product_stats.rename(columns={'mean': 'avg_score', 'std': 'score_std_dev'})
-    
-    # Save the result
-    target_file_path = os.path.join(os.path.dirname(script_path), "Gold", "amazon-detect-rating-anomalies.csv")
-    product_stats.to_csv(target_file_path, index=False)
+def detect_rating_anomalies(grouped, df):
+    # Mean and standard deviation of scores for each product
+    product_stats = grouped[['ProductId']].assign(avg_score=average(grouped), score_std_dev=standard_deviation(grouped))
+    return {"amazon-detect-rating-anomalies": product_stats}
 
 # Function to check for consistency in user ratings
-def consistency_in_user_ratings(df):
-    # Calculate average rating given by each user and the overall average rating of all reviews
-    user_avg_score = df.groupby('UserId')['Score'].mean().reset_index(name='user_avg_score')
-    overall_avg_score = df['Score'].mean()
-    
+def consistency_in_user_ratings(grouped, df):
+    user_avg_score = grouped[['UserId']].assign(user_avg_score=average(grouped))
+
+    # The overall average rating of all reviews, taken from the per user sums instead of another scan
+    overall_avg_score = grouped['score_sum'].sum() / grouped['score_count'].sum()
+
     # Calculate difference from the overall average to spot biases
     user_avg_score['bias'] = user_avg_score['user_avg_score'] - overall_avg_score
-    
-    # Save the result
-    target_file_path = os.path.join(os.path.dirname(script_path), "Gold", "amazon-consistency-in-user-ratings.csv")
-    user_avg_score.to_csv(target_file_path, index=False)
-
-# Call functions to run analysis and save results
-top_low_rated_products(data)
-popularity_vs_satisfaction(data)
-product_improvements_over_time(data)
-top_reviewers(data)
-helpfulness_voting_patterns(data)
-helpfulness_ratio_analysis(data)
-trend_analysis_over_time(data)
-seasonal_popularity(data)
-detect_rating_anomalies(data)
-consistency_in_user_ratings(data)
+    return {"amazon-consistency-in-user-ratings": user_avg_score}
+
+
+# Declaration of every Gold report: the keys it groups by and the aggregates it reads from the groupby
+SCORES = [1, 2, 3, 4, 5]
+SCORE_COUNT = {'score_count': ('Score', 'size'), 'score_sum': ('Score', 'sum')}
+
+REPORTS = [
+    {'name': 'top_low_rated_products', 'keys': ['ProductId', 'Year'],
+     'aggregates': SCORE_COUNT,
+     'build': top_low_rated_products},
+    {'name': 'popularity_vs_satisfaction', 'keys': ['ProductId', 'Score'],
+     'aggregates': {'score_count': ('Score', 'size')},
+     'build': popularity_vs_satisfaction},
+    {'name': 'product_improvements_over_time', 'keys': ['ProductId', 'Year'],
+     'aggregates': SCORE_COUNT,
+     'build': product_improvements_over_time},
+    {'name': 'top_reviewers', 'keys': ['UserId'],
+     'aggregates': SCORE_COUNT,
+     'build': top_reviewers},
+    {'name': 'helpfulness_voting_patterns', 'keys': ['UserId'],
+     'aggregates': {'total_helpfulness_numerator': ('HelpfulnessNumerator', 'sum'),
+                    'total_helpfulness_denominator': ('HelpfulnessDenominator', 'sum')},
+     'build': helpfulness_voting_patterns},
+    {'name': 'helpfulness_ratio_analysis', 'keys': None,
+     'build': helpfulness_ratio_analysis},
+    {'name': 'trend_analysis_over_time', 'keys': ['Year'],
+     'aggregates': SCORE_COUNT,
+     'build': trend_analysis_over_time},
+    {'name': 'seasonal_popularity', 'keys': ['Month'],
+     'aggregates': SCORE_COUNT,
+     'build': seasonal_popularity},
+    {'name': 'detect_rating_anomalies', 'keys': ['ProductId'],
+     'aggregates': {**SCORE_COUNT, 'score_squared_sum': ('score_squared', 'sum')},
+     'build': detect_rating_anomalies},
+    {'name': 'consistency_in_user_ratings', 'keys': ['UserId'],
+     'aggregates': SCORE_COUNT,
+     'build': consistency_in_user_ratings},
+]
+
+
+# Gold tables that hold Silver rows rather than aggregates, the incremental mode appends to them
+ROW_LEVEL_TABLES = ["amazon-helpfulness-ratio-analysis"]
+
+
+# Run every report over the Silver file and save the Gold tables.
+# In incremental mode only the rows newer than the saved watermark are read and folded into the saved state.
+# In out-of-core mode a full rebuild goes through spill partitions instead of loading the whole file.
+def silver_to_gold(silver_file, gold_dir, reports=REPORTS, incremental=INCREMENTAL, out_of_core=OUT_OF_CORE,
+                   memory_budget_mb=MEMORY_BUDGET_MB, workers=OUT_OF_CORE_WORKERS):
+    with span("silver_to_gold", incremental=incremental, out_of_core=out_of_core) as run:
+        state_dir = os.path.join(gold_dir, "_state")
+        watermark, previous_states = load_state(state_dir) if incremental else (None, {})
+
+        if out_of_core and watermark is None:
+            # The tables of the row level reports are written while the file is streamed
+            outputs, timings, states, max_time = run_reports_out_of_core(
+                silver_file, gold_dir, reports, lambda chunk_rows: load_silver_chunks(silver_file, chunk_rows),
+                prepare, PARTITION_KEYS, memory_budget_mb, workers)
+            # Not in memory, the Ids of the watermark Time are read back from the file
+            reviews = None
+        else:
+            with span("gold.load") as stage:
+                if watermark is None:
+                    data = load_silver(silver_file)
+                else:
+                    data = load_new_reviews(silver_file, watermark)
+                    print(f"Incremental refresh: {len(data)} new reviews from Time {watermark['Time']}")
+                data = prepare(data)
+                stage.rows_out = len(data)
+                stage.bytes_read = file_size(silver_file)
+            run.rows_in = len(data)
+
+            outputs, timings, states = run_reports(data, reports, previous_states if watermark is not None else None)
+            max_time = data['Time'].max() if len(data) else None
+            reviews = data[['Id', 'Time']]
+
+        # Save the results
+        for name, tables in outputs.items():
+            with span(f"gold.write.{name}") as stage:
+                start = time.perf_counter()
+                rows_written = 0
+                bytes_written = 0
+                for table_name, table in tables.items():
+                    target_path = table_path(gold_dir, table_name)
+
+                    # Reports on the rows themselves only saw the new rows, add them to the rows saved before.
+                    # Rows past the watermark, or of its Time but not in its Ids, are dropped first in case an earlier
+                    # refresh stopped before saving its state.
+                    if watermark is not None and table_name in ROW_LEVEL_TABLES and os.path.exists(target_path):
+                        saved = read_table(target_path, filters=[('Time', '<=', watermark['Time'])])
+                        saved = saved[(saved['Time'] < watermark['Time']) | saved['Id'].isin(watermark['boundary_ids'])]
+                        table = pd.concat([saved, table], ignore_index=True)
+
+                    write_table(table, target_path)
+                    rows_written += len(table)
+                    bytes_written += file_size(target_path) or 0
+                timings[name]['write'] = time.perf_counter() - start
+                stage.rows_out = rows_written
+                stage.bytes_written = bytes_written
+
+        # Save the state last, a refresh that fails before this point is redone from the previous state
+        if incremental:
+            new_watermark = max_time
+            if watermark is not None and (new_watermark is None or new_watermark < watermark['Time']):
+                new_watermark = watermark['Time']
+            if new_watermark is not None:
+                with span("gold.save_state"):
+                    save_state(state_dir, states, new_watermark, watermark,
+                               watermark_ids(silver_file, reviews, new_watermark, watermark))
+
+    return timings
+
+
+if __name__ == "__main__":
+    print("Path of the file is :", target_file_path)
+
+    if MEMORY_REPORT:
+        memory_report(target_file_path)
+
+    # Call functions to run analysis and save results
+    timings = silver_to_gold(target_file_path, gold_path)
+    print_timings(timings)
+
+    # Fresh top-10s for the dashboards without sorting the full history
+    refresh_top_k(target_file_path, gold_path, os.path.join(gold_path, "_state"), TOP_K, TOP_K_CAPACITY)
+    if VALIDATE_TOP_K:
+        validate_top_k(target_file_path, TOP_K, TOP_K_CAPACITY)
@@ -0,0 +1,110 @@
+import pandas as pd
+import time
+
+from instrumentation import span
+
+# Shared aggregation engine for the Gold reports.
+#
+# Every report is a dict that declares what it needs from the data:
+#   'name'       - name used in the timing breakdown
+#   'keys'       - columns to group by, or None for reports that work on the rows themselves
+#   'aggregates' - named aggregations, output column -> (input column, function), as in DataFrame.agg
+#   'build'      - function(grouped, data) returning {gold table name: DataFrame}
+#
+# Reports with the same keys share one groupby, so the data is scanned once per key set
+# instead of once per report.
+#
+# Aggregates are limited to counts and sums. Those are mergeable: the state of a key set computed
+# on new rows can be added to the state computed earlier, which is what the incremental mode relies on.
+# Means and standard deviations are derived from them in the build functions.
+MERGEABLE_FUNCTIONS = ('size', 'count', 'sum')
+
+
+# Collect the reports by key set and merge their aggregates into one spec per key set
+def plan_key_sets(reports):
+    key_sets = {}
+    for report in reports:
+        keys = tuple(report['keys']) if report['keys'] is not None else None
+        key_set = key_sets.setdefault(keys, {'reports': [], 'aggregates': {}})
+        key_set['reports'].append(report)
+
+        for column, spec in report.get('aggregates', {}).items():
+            if spec[1] not in MERGEABLE_FUNCTIONS:
+                raise ValueError(f"Aggregate {column} of report {report['name']} uses {spec[1]}, only {MERGEABLE_FUNCTIONS} can be merged")
+            known = key_set['aggregates'].setdefault(column, spec)
+            if known != spec:
+                raise ValueError(f"Aggregate {column} of report {report['name']} is declared twice with different definitions for keys {keys}")
+    return key_sets
+
+
+# Group data by keys and compute the aggregates, the state of one key set
+def aggregate(data, keys, aggregates):
+    # observed=True keeps categorical keys to the combinations that occur in the data
+    return data.groupby(list(keys), observed=True).agg(**aggregates).reset_index()
+
+
+# Fold the state computed on new rows into the state kept from earlier runs
+def merge_states(previous, new, keys):
+    if previous is None or len(previous) == 0:
+        return new
+    return pd.concat([previous, new], ignore_index=True).groupby(list(keys), observed=True).sum().reset_index()
+
+
+# Build every report from the state of its key set (grouped) and the data.
+# groupby_times holds the time spent computing the state of every key set.
+def build_reports(key_sets, states, data, groupby_times):
+    outputs = {}
+    timings = {}
+
+    for keys, key_set in key_sets.items():
+        for report in key_set['reports']:
+            with span(f"gold.build.{report['name']}", keys=list(keys) if keys else None) as stage:
+                start = time.perf_counter()
+                outputs[report['name']] = report['build'](states.get(keys), data)
+                stage.rows_in = len(states[keys]) if keys in states else (len(data) if data is not None else None)
+                stage.rows_out = sum(len(table) for table in outputs[report['name']].values())
+            timings[report['name']] = {
+                'keys': keys,
+                'groupby': groupby_times.get(keys, 0.0),
+                'shared_by': len(key_set['reports']),
+                'build': time.perf_counter() - start,
+            }
+
+    return outputs, timings
+
+
+# Run one shared groupby per key set and build every report from it.
+# With previous_states the groupby only covers data (the new rows) and is merged into the earlier state.
+# Returns the Gold tables of every report, the time spent per report and the state of every key set.
+def run_reports(data, reports, previous_states=None):
+    key_sets = plan_key_sets(reports)
+    states = {}
+    groupby_times = {}
+
+    for keys, key_set in key_sets.items():
+        if keys is None:
+            continue
+        with span("gold.groupby", keys=list(keys), reports=len(key_set['reports'])) as stage:
+            start = time.perf_counter()
+            states[keys] = aggregate(data, keys, key_set['aggregates'])
+            if previous_states is not None:
+                states[keys] = merge_states(previous_states.get(keys), states[keys], keys)
+            groupby_times[keys] = time.perf_counter() - start
+            stage.rows_in = len(data)
+            stage.rows_out = len(states[keys])
+
+    outputs, timings = build_reports(key_sets, states, data, groupby_times)
+    return outputs, timings, states
+
+
+# Print the per report timing breakdown. The groupby time of a key set is paid once and shared by its reports.
+def print_timings(timings):
+    print(f"{'Report':<35} {'Keys':<20} {'Groupby (shared)':>18} {'Build':>8} {'Write':>8}")
+    for name, timing in timings.items():
+        keys = ', '.join(timing['keys']) if timing['keys'] else '-'
+        groupby = f"{timing['groupby']:.3f}s /{timing['shared_by']}"
+        print(f"{name:<35} {keys:<20} {groupby:>18} {timing['build']:>7.3f}s {timing.get('write', 0):>7.3f}s")
+
+    total_groupby = sum({timing['keys']: timing['groupby'] for timing in timings.values()}.values())
+    total_rest = sum(timing['build'] + timing.get('write', 0) for timing in timings.values())
+    print(f"Total: {total_groupby + total_rest:.3f}s ({total_groupby:.3f}s in shared groupbys)")
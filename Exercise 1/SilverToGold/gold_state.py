@@ -0,0 +1,62 @@
+import json
+import os
+
+from storage import read_table, table_path, write_table
+
+# Persistent state of the incremental Gold refresh.
+#
+# For every key set the state holds the mergeable aggregates (counts and sums) per key, and a
+# watermark holds the highest Time already folded into it with the Ids of the reviews of that Time
+# (Time is whole days, a later load can still bring reviews of the same day). The state files of one refresh carry a
+# version number and watermark.json is replaced last, so a refresh that stops half way leaves the
+# previous state and watermark untouched.
+WATERMARK_FILE = "watermark.json"
+
+
+# File name of the state of one key set, e.g. state-ProductId-Year-3
+def state_name(keys, version):
+    return "state-" + "-".join(keys) + f"-{version}"
+
+
+# Load the watermark and the state of every key set. Returns (None, {}) when there is no state yet.
+def load_state(state_dir):
+    watermark_path = os.path.join(state_dir, WATERMARK_FILE)
+    if not os.path.exists(watermark_path):
+        return None, {}
+
+    with open(watermark_path) as file:
+        watermark = json.load(file)
+
+    states = {}
+    for keys in watermark['key_sets']:
+        keys = tuple(keys)
+        states[keys] = read_table(table_path(state_dir, state_name(keys, watermark['version'])))
+    return watermark, states
+
+
+# Save the state of every key set and move the watermark to time_watermark, boundary_ids being the Ids of
+# every review of that Time folded into the state
+def save_state(state_dir, states, time_watermark, previous=None, boundary_ids=()):
+    os.makedirs(state_dir, exist_ok=True)
+    version = previous['version'] + 1 if previous else 1
+
+    for keys, state in states.items():
+        write_table(state, table_path(state_dir, state_name(keys, version)))
+
+    watermark = {
+        'version': version,
+        'Time': int(time_watermark),
+        'boundary_ids': sorted(int(review_id) for review_id in boundary_ids),
+        'key_sets': [list(keys) for keys in states],
+    }
+    temporary_path = os.path.join(state_dir, WATERMARK_FILE + ".tmp")
+    with open(temporary_path, 'w') as file:
+        json.dump(watermark, file)
+    os.replace(temporary_path, os.path.join(state_dir, WATERMARK_FILE))
+
+    # The previous version is no longer referenced
+    if previous:
+        for keys in previous['key_sets']:
+            old_path = table_path(state_dir, state_name(keys, previous['version']))
+            if os.path.exists(old_path):
+                os.remove(old_path)
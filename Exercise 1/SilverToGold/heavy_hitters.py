@@ -0,0 +1,183 @@
+import heapq
+import json
+import os
+from collections import Counter
+
+import pandas as pd
+
+from instrumentation import span
+from storage import read_table, read_table_chunks, table_path, write_table
+
+# Streaming top-K (heavy hitter) counts of reviewers and products.
+#
+# SpaceSaving keeps at most `capacity` keys with a count and an error each. A key that is not monitored
+# replaces the key with the smallest count and inherits that count as its error, so for every monitored
+# key the true count lies between count - error and count, and any other key occurs at most min_count times.
+# Memory is set by the capacity, not by the number of distinct reviewers or products.
+# ExactCounter counts every key (memory grows with the distinct keys), it is kept to validate the sketch.
+
+
+class SpaceSaving:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # Min-heap of (count, key). Entries go stale when a count grows, they are skipped when popped.
+        self.heap = []
+
+    # Add count occurrences of key
+    def add(self, key, count=1):
+        if key in self.counts:
+            self.counts[key] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = count
+            self.errors[key] = 0
+        else:
+            # Evict the key with the smallest count, the new key takes over its count as error
+            minimum, evicted = self.pop_minimum()
+            del self.counts[evicted]
+            del self.errors[evicted]
+            self.counts[key] = minimum + count
+            self.errors[key] = minimum
+        heapq.heappush(self.heap, (self.counts[key], key))
+
+        # Drop the stale entries once they outnumber the live ones
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(count, key) for key, count in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def pop_minimum(self):
+        while True:
+            count, key = heapq.heappop(self.heap)
+            if self.counts.get(key) == count:
+                return count, key
+
+    # Add the counts of a chunk, e.g. chunk['UserId'].value_counts()
+    def update(self, counts):
+        for key, count in counts.items():
+            self.add(key, int(count))
+
+    # Smallest monitored count: no key outside the sketch occurs more often than this
+    def min_count(self):
+        return min(self.counts.values()) if len(self.counts) == self.capacity else 0
+
+    # The n keys with the highest counts, with the error bound of each count. 'guaranteed' is True when
+    # the key is in the true top n whatever the errors are (its lowest possible count beats the (n+1)th count).
+    def top(self, n, key_name='key'):
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+        threshold = ranked[n][1] if len(ranked) > n else self.min_count()
+        return pd.DataFrame(
+            [(key, count, self.errors[key], count - self.errors[key] >= threshold) for key, count in ranked[:n]],
+            columns=[key_name, 'num_reviews', 'max_error', 'guaranteed'],
+        )
+
+    def to_frame(self):
+        return pd.DataFrame({'key': list(self.counts), 'count': list(self.counts.values()), 'error': [self.errors[key] for key in self.counts]})
+
+    @classmethod
+    def from_frame(cls, capacity, frame):
+        sketch = cls(capacity)
+        for key, count, error in zip(frame['key'], frame['count'], frame['error']):
+            sketch.counts[key] = int(count)
+            sketch.errors[key] = int(error)
+        sketch.heap = [(count, key) for key, count in sketch.counts.items()]
+        heapq.heapify(sketch.heap)
+        return sketch
+
+
+class ExactCounter:
+    def __init__(self):
+        self.counts = Counter()
+
+    def update(self, counts):
+        for key, count in counts.items():
+            self.counts[key] += int(count)
+
+    def top(self, n, key_name='key'):
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:n]
+        return pd.DataFrame(
+            [(key, count, 0, True) for key, count in ranked],
+            columns=[key_name, 'num_reviews', 'max_error', 'guaranteed'],
+        )
+
+
+# Gold table written for every sketched column
+TOP_K_TABLES = {
+    'UserId': "amazon-top-reviewers-topk",
+    'ProductId': "amazon-top-products-topk",
+}
+
+
+# Fold the Silver rows newer than the sketch watermark into the saved sketches and write the top n tables.
+# The sketches and their watermark are kept in state_dir, so a refresh only reads the new rows, chunk by chunk.
+# Time is whole days, so the watermark also keeps the Ids of the reviews of its Time already folded in:
+# reviews of the same day that arrive in a later load are still counted, and counted once.
+def refresh_top_k(silver_file, gold_dir, state_dir, n=10, capacity=1000, chunk_rows=1_000_000):
+    watermark_path = os.path.join(state_dir, "topk-watermark.json")
+
+    watermark = None
+    folded_ids = set()
+    sketches = {column: SpaceSaving(capacity) for column in TOP_K_TABLES}
+    if os.path.exists(watermark_path):
+        with open(watermark_path) as file:
+            state = json.load(file)
+        watermark = state['Time']
+        folded_ids = set(state['boundary_ids'])
+        for column in TOP_K_TABLES:
+            sketches[column] = SpaceSaving.from_frame(capacity, read_table(table_path(state_dir, f"topk-{column}")))
+
+    filters = [('Time', '>=', watermark)] if watermark is not None else None
+    new_watermark = watermark
+    boundary_ids = set(folded_ids)
+    with span("gold.top_k", capacity=capacity) as stage:
+        rows = 0
+        for chunk in read_table_chunks(silver_file, chunk_rows, columns=list(TOP_K_TABLES) + ['Id', 'Time'], filters=filters):
+            if watermark is not None:
+                chunk = chunk[~((chunk['Time'] == watermark) & chunk['Id'].isin(folded_ids))]
+
+            rows += len(chunk)
+            for column, sketch in sketches.items():
+                sketch.update(chunk[column].value_counts(sort=False))
+            if len(chunk):
+                chunk_max = int(chunk['Time'].max())
+                if new_watermark is None or chunk_max > new_watermark:
+                    new_watermark = chunk_max
+                    boundary_ids = set()
+                if chunk_max == new_watermark:
+                    boundary_ids |= set(chunk.loc[chunk['Time'] == new_watermark, 'Id'].tolist())
+        stage.rows_in = rows
+
+    tables = {}
+    for column, sketch in sketches.items():
+        tables[column] = sketch.top(n, key_name=column)
+        write_table(tables[column], table_path(gold_dir, TOP_K_TABLES[column]))
+
+    # Save the sketches, then move the watermark
+    os.makedirs(state_dir, exist_ok=True)
+    for column, sketch in sketches.items():
+        write_table(sketch.to_frame(), table_path(state_dir, f"topk-{column}"))
+    if new_watermark is not None:
+        with open(watermark_path, 'w') as file:
+            json.dump({'Time': new_watermark, 'boundary_ids': sorted(int(review_id) for review_id in boundary_ids)}, file)
+
+    return tables
+
+
+# Compare the sketch top n with exact counts over the same Silver file (exact mode uses memory per distinct key)
+def validate_top_k(silver_file, n=10, capacity=1000, chunk_rows=1_000_000):
+    exact = {column: ExactCounter() for column in TOP_K_TABLES}
+    sketch = {column: SpaceSaving(capacity) for column in TOP_K_TABLES}
+    for chunk in read_table_chunks(silver_file, chunk_rows, columns=list(TOP_K_TABLES)):
+        for column in TOP_K_TABLES:
+            counts = chunk[column].value_counts(sort=False)
+            exact[column].update(counts)
+            sketch[column].update(counts)
+
+    for column in TOP_K_TABLES:
+        true_counts = exact[column].counts
+        approximate = sketch[column].top(n, key_name=column)
+        exact_keys = set(exact[column].top(n, key_name=column)[column])
+        overlap = len(exact_keys & set(approximate[column]))
+        worst = max((count - true_counts[key] for key, count in zip(approximate[column], approximate['num_reviews'])), default=0)
+        print(f"{column}: {overlap}/{n} of the exact top {n} found, largest overcount {worst}, "
+              f"largest error bound {approximate['max_error'].max() if len(approximate) else 0}")
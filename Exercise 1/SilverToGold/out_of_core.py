@@ -0,0 +1,156 @@
+import math
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from gold_engine import aggregate, build_reports, merge_states, plan_key_sets
+from instrumentation import span
+from storage import ChunkWriter, count_rows, read_table, table_path, write_table
+
+# Out-of-core execution of the Gold reports, for Silver files that do not fit in memory.
+#
+# 1. The Silver file is read in chunks. Reports on the rows themselves are written chunk by chunk,
+#    key sets without a partition key (Year, Month) are aggregated per chunk and merged, and every
+#    chunk is hash-partitioned on each partition key (ProductId, UserId) into spill files on disk.
+# 2. Every spill partition holds all the rows of its keys, so it is aggregated on its own,
+#    optionally on separate cores, and the partition results are concatenated in key order.
+# Memory is bounded by the chunk size and the partition size, both derived from the memory budget. The
+# chunks are read by one process and get the whole budget; partitions are aggregated by up to `workers`
+# processes at once, so each one is sized to budget / workers.
+# Hash partitioning cannot split a single key: all the reviews of one very active product or user land in
+# the same partition, so a hot key larger than a partition's share of the budget still overruns it.
+
+# Rough in-memory cost of one typed review row while it is grouped, used to size chunks and partitions
+BYTES_PER_ROW = 200
+
+
+# Number of rows that fit in the memory budget
+def rows_per_budget(memory_budget_mb):
+    return max(1, int(memory_budget_mb * 1024 * 1024 // BYTES_PER_ROW))
+
+
+# First partition key that is part of keys, None for key sets that are merged chunk by chunk
+def partition_key_of(keys, partition_keys):
+    for key in partition_keys:
+        if key in keys:
+            return key
+    return None
+
+
+# Aggregate one spill partition (its part files) for every key set of its partition key
+def aggregate_partition(part_paths, key_set_aggregates):
+    data = pd.concat([read_table(path) for path in part_paths], ignore_index=True)
+    return {keys: aggregate(data, keys, aggregates) for keys, aggregates in key_set_aggregates.items()}
+
+
+# Run the reports over silver_file without loading it whole.
+# load_chunks(chunk_rows) yields the Silver file in chunks, prepare derives the columns the aggregates read.
+# Returns the Gold tables of the aggregated reports, the time spent per report, the state of every key set
+# and the highest Time seen. The tables of row level reports are written to gold_dir as they are built.
+def run_reports_out_of_core(silver_file, gold_dir, reports, load_chunks, prepare, partition_keys,
+                            memory_budget_mb, workers=None, spill_dir=None):
+    key_sets = plan_key_sets(reports)
+    spill_dir = spill_dir or os.path.join(gold_dir, "_spill")
+    chunk_rows = rows_per_budget(memory_budget_mb)
+    partition_rows = rows_per_budget(memory_budget_mb / (workers or 1))
+    partitions = max(1, math.ceil(count_rows(silver_file) / partition_rows))
+    print(f"Out-of-core run: chunks of {chunk_rows} rows, {partitions} partitions per key "
+          f"of about {partition_rows} rows")
+
+    # Key sets aggregated per spill partition, grouped by partition key, and the columns each spill needs
+    partitioned = {}
+    for keys, key_set in key_sets.items():
+        key = partition_key_of(keys, partition_keys) if keys is not None else None
+        if key is not None:
+            partitioned.setdefault(key, {})[keys] = key_set['aggregates']
+    spill_columns = {
+        key: sorted({column for keys, aggregates in key_sets_of_key.items()
+                     for column in list(keys) + [spec[0] for spec in aggregates.values()]})
+        for key, key_sets_of_key in partitioned.items()
+    }
+
+    states = {}
+    groupby_times = {keys: 0.0 for keys in key_sets if keys is not None}
+    row_reports = key_sets.get(None, {'reports': []})['reports']
+    row_writers = {}
+    row_timings = {report['name']: 0.0 for report in row_reports}
+    max_time = None
+
+    # 1. One pass over the Silver file
+    shutil.rmtree(spill_dir, ignore_errors=True)
+    with span("gold.out_of_core.scan", chunk_rows=chunk_rows, partitions=partitions) as stage:
+        rows = 0
+        try:
+            for chunk_number, chunk in enumerate(load_chunks(chunk_rows)):
+                rows += len(chunk)
+                chunk = prepare(chunk)
+                chunk_max_time = chunk['Time'].max()
+                max_time = chunk_max_time if max_time is None else max(max_time, chunk_max_time)
+
+                for report in row_reports:
+                    start = time.perf_counter()
+                    for table_name, table in report['build'](None, chunk).items():
+                        if table_name not in row_writers:
+                            row_writers[table_name] = ChunkWriter(table_path(gold_dir, table_name))
+                        row_writers[table_name].write(table)
+                    row_timings[report['name']] += time.perf_counter() - start
+
+                for keys, key_set in key_sets.items():
+                    if keys is not None and partition_key_of(keys, partition_keys) is None:
+                        start = time.perf_counter()
+                        states[keys] = merge_states(states.get(keys), aggregate(chunk, keys, key_set['aggregates']), keys)
+                        groupby_times[keys] += time.perf_counter() - start
+
+                for key, columns in spill_columns.items():
+                    hashes = pd.util.hash_pandas_object(chunk[key], index=False).to_numpy() % partitions
+                    for partition, part in chunk[columns].groupby(hashes):
+                        partition_dir = os.path.join(spill_dir, key, str(partition))
+                        os.makedirs(partition_dir, exist_ok=True)
+                        write_table(part, table_path(partition_dir, f"part-{chunk_number}"))
+        finally:
+            for writer in row_writers.values():
+                writer.close()
+        stage.rows_in = rows
+
+    # 2. Aggregate the spill partitions and concatenate them in key order
+    try:
+        with ProcessPoolExecutor(max_workers=workers) if workers else _InProcess() as pool:
+            for key, key_set_aggregates in partitioned.items():
+                with span("gold.out_of_core.partitions", key=key) as stage:
+                    start = time.perf_counter()
+                    key_dir = os.path.join(spill_dir, key)
+                    part_lists = [[os.path.join(key_dir, partition, name) for name in sorted(os.listdir(os.path.join(key_dir, partition)))]
+                                  for partition in sorted(os.listdir(key_dir))] if os.path.isdir(key_dir) else []
+                    results = list(pool.map(aggregate_partition, part_lists, [key_set_aggregates] * len(part_lists)))
+
+                    for keys in key_set_aggregates:
+                        parts = [result[keys] for result in results]
+                        states[keys] = pd.concat(parts, ignore_index=True).sort_values(list(keys), ignore_index=True)
+                    elapsed = time.perf_counter() - start
+                    stage.rows_out = sum(len(states[keys]) for keys in key_set_aggregates)
+                for keys in key_set_aggregates:
+                    groupby_times[keys] = elapsed
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    aggregated_key_sets = {keys: key_set for keys, key_set in key_sets.items() if keys is not None}
+    outputs, timings = build_reports(aggregated_key_sets, states, None, groupby_times)
+    for report in row_reports:
+        timings[report['name']] = {'keys': None, 'groupby': 0.0, 'shared_by': 1, 'build': row_timings[report['name']]}
+
+    return outputs, timings, states, max_time
+
+
+# Stand-in for the process pool when the partitions are aggregated in this process
+class _InProcess:
+    def map(self, function, *iterables):
+        return map(function, *iterables)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
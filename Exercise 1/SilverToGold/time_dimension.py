@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+# Time dimension of the reviews.
+# The Silver Time column holds epoch seconds. Year, Month and Date are derived from it once per load with
+# numpy datetime arithmetic (no string parsing, no pandas .dt accessors) and kept as small integer columns
+# next to the data, so every Gold report groups on the same values and none of them touches Time itself.
+SECONDS_PER_DAY = 86400
+
+
+# Build the Year (int16), Month (int8) and Date (int32, as yyyymmdd) columns for an array of epoch seconds
+def time_dimension(epoch_seconds):
+    days = (np.asarray(epoch_seconds, dtype='int64') // SECONDS_PER_DAY).astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+
+    year = days.astype('datetime64[Y]').astype('int64') + 1970
+    month = months.astype('int64') % 12 + 1
+    day = (days - months).astype('int64') + 1
+
+    return pd.DataFrame({
+        'Year': year.astype('int16'),
+        'Month': month.astype('int8'),
+        'Date': (year * 10000 + month * 100 + day).astype('int32'),
+    })
+
+
+# Return a copy of df with the time dimension columns added, the input frame is not modified
+def add_time_dimension(df, time_column='Time'):
+    dimension = time_dimension(df[time_column].to_numpy())
+    dimension.index = df.index
+    return pd.concat([df, dimension], axis=1)
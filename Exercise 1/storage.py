@@ -0,0 +1,266 @@
+import pandas as pd
+import os
+
+# Storage layer shared by the Silver and Gold layers (and the reports in Exercise 4).
+# Parquet keeps the column types, so the next layer does not have to parse text and guess dtypes
+# again, and it can load only the columns it needs. Arrow IPC ("arrow") is the faster choice for
+# files that are written and read back on the same machine. CSV and JSON stay available as export formats.
+# The columnar formats need pyarrow installed.
+STORAGE_FORMAT = "parquet"
+
+EXTENSIONS = {
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+    "csv": ".csv",
+    "json": ".json",
+}
+
+
+# Build the path of a table called name (without extension) inside directory
+def table_path(directory, name, fmt=None):
+    return os.path.join(directory, name + EXTENSIONS[fmt or STORAGE_FORMAT])
+
+
+# Find the format of a file from its extension
+def format_of(path):
+    extension = os.path.splitext(path)[1]
+    for fmt, known_extension in EXTENSIONS.items():
+        if extension == known_extension:
+            return fmt
+    raise ValueError(f"Unknown storage format for file: {path}")
+
+
+# Write a DataFrame to path in the format given by the extension
+def write_table(df, path):
+    fmt = format_of(path)
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    elif fmt == "arrow":
+        df.reset_index(drop=True).to_feather(path)
+    elif fmt == "csv":
+        df.to_csv(path, index=False)
+    else:
+        df.to_json(path, orient="records", lines=True)
+
+
+# Read a table from path. When columns is given only those columns are loaded,
+# the columnar formats skip the other columns on disk instead of parsing and dropping them.
+# filters is a list of (column, operator, value) conditions that every row must meet, e.g. [('Time', '>', 0)].
+# Parquet uses them to skip whole row groups, the other formats filter after reading.
+# dtypes maps columns to the type to load them as; 'category' columns are dictionary-encoded while reading
+# where the format allows it, so the strings are never materialized as Python objects.
+def read_table(path, columns=None, filters=None, dtypes=None):
+    fmt = format_of(path)
+    dtypes = dtypes or {}
+    if columns is not None:
+        dtypes = {column: dtype for column, dtype in dtypes.items() if column in columns}
+    categories = [column for column, dtype in dtypes.items() if dtype == 'category']
+
+    if fmt == "parquet":
+        df = pd.read_parquet(path, columns=columns, filters=filters, read_dictionary=categories or None)
+        df = df.astype(dtypes) if dtypes else df
+        return sort_categories(df, categories)
+
+    if fmt == "arrow":
+        df = pd.read_feather(path, columns=columns)
+    elif fmt == "csv":
+        df = pd.read_csv(path, usecols=columns, dtype=dtypes or None)
+    else:
+        df = pd.read_json(path, orient="records", lines=True)
+        df = df[columns] if columns is not None else df
+    if dtypes and fmt != "csv":
+        df = df.astype(dtypes)
+    df = sort_categories(df, categories)
+    return apply_filters(df, filters) if filters else df
+
+
+# Put the categories of the given columns in sorted order. The dictionary of a file follows the order
+# the values first appear in, and a groupby on a category column is ordered by its categories,
+# so this keeps the groupby output in the same order as it has for plain string columns.
+def sort_categories(df, columns):
+    for column in columns:
+        df[column] = df[column].cat.reorder_categories(sorted(df[column].cat.categories))
+    return df
+
+
+OPERATORS = {
+    '==': lambda column, value: column == value,
+    '!=': lambda column, value: column != value,
+    '>': lambda column, value: column > value,
+    '>=': lambda column, value: column >= value,
+    '<': lambda column, value: column < value,
+    '<=': lambda column, value: column <= value,
+}
+
+
+# Keep the rows of df that meet every (column, operator, value) condition
+def apply_filters(df, filters):
+    mask = pd.Series(True, index=df.index)
+    for column, operator, value in filters:
+        mask &= OPERATORS[operator](df[column], value)
+    return df[mask]
+
+
+# Read a table in chunks of about chunk_rows rows, for jobs that must not hold the whole table in memory.
+# columns, filters and dtypes work as in read_table (categories are dictionary-encoded per chunk,
+# filters are applied to every chunk and need their columns in columns).
+def read_table_chunks(path, chunk_rows, columns=None, filters=None, dtypes=None):
+    fmt = format_of(path)
+    dtypes = dtypes or {}
+    if columns is not None:
+        dtypes = {column: dtype for column, dtype in dtypes.items() if column in columns}
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns))
+    elif fmt == "arrow":
+        import pyarrow as pa
+        reader = pa.ipc.open_file(path)
+        chunks = (reader.get_batch(i).to_pandas() for i in range(reader.num_record_batches))
+        chunks = (chunk[columns] if columns is not None else chunk for chunk in chunks)
+    elif fmt == "csv":
+        chunks = pd.read_csv(path, usecols=columns, chunksize=chunk_rows)
+    else:
+        chunks = pd.read_json(path, orient="records", lines=True, chunksize=chunk_rows)
+        chunks = (chunk[columns] if columns is not None else chunk for chunk in chunks)
+
+    for chunk in chunks:
+        chunk = chunk.astype(dtypes) if dtypes else chunk
+        yield apply_filters(chunk, filters) if filters else chunk
+
+
+# Number of rows of a table. The columnar formats read it from the file metadata, the text formats count lines.
+def count_rows(path):
+    fmt = format_of(path)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    if fmt == "arrow":
+        import pyarrow as pa
+        reader = pa.ipc.open_file(path)
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+    with open(path, 'rb') as file:
+        lines = sum(block.count(b'\n') for block in iter(lambda: file.read(1024 * 1024), b''))
+    return lines - 1 if fmt == "csv" else lines
+
+
+# Export a stored table to CSV next to it (same name, .csv extension) and return the new path
+def export_csv(path):
+    csv_path = os.path.splitext(path)[0] + EXTENSIONS["csv"]
+    read_table(path).to_csv(csv_path, index=False)
+    return csv_path
+
+
+# Type two chunks of a column can both be stored as: integers widen to int64, integers and floats to float64,
+# anything else that differs (e.g. Zip Codes read as int64 in one chunk and as strings in the next) to strings
+def promote_type(current, new):
+    import pyarrow as pa
+
+    if current == new or pa.types.is_null(new):
+        return current
+    if pa.types.is_null(current):
+        return new
+    if pa.types.is_dictionary(current) or pa.types.is_dictionary(new):
+        values = promote_type(current.value_type if pa.types.is_dictionary(current) else current,
+                              new.value_type if pa.types.is_dictionary(new) else new)
+        return pa.dictionary(pa.int32(), values)
+    if pa.types.is_integer(current) and pa.types.is_integer(new):
+        return pa.int64()
+    if (pa.types.is_integer(current) or pa.types.is_floating(current)) and (pa.types.is_integer(new) or pa.types.is_floating(new)):
+        return pa.float64()
+    return pa.string()
+
+
+# Writer used by the streaming jobs: every call to write() appends one chunk to the same table
+class ChunkWriter:
+    def __init__(self, path):
+        self.path = path
+        self.fmt = format_of(path)
+        self.schema = None
+        self.writer = None
+        self.first_chunk = True
+        # File the columnar writer writes to, a promoted copy of the table until it is closed
+        self.current_path = path
+        self.promotions = 0
+
+    # Field as it is stored: dictionary (category) columns get 32-bit indices, a later chunk may hold more
+    # distinct values. Arrow IPC files allow only one dictionary per column, so there they are stored as plain values.
+    def storage_field(self, field):
+        import pyarrow as pa
+
+        if pa.types.is_dictionary(field.type):
+            value_type = field.type.value_type
+            return pa.field(field.name, pa.dictionary(pa.int32(), value_type) if self.fmt == "parquet" else value_type, field.nullable)
+        return field
+
+    def open_writer(self, path, schema):
+        import pyarrow as pa
+
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+            return pq.ParquetWriter(path, schema)
+        return pa.ipc.new_file(path, schema)
+
+    def write(self, chunk):
+        if self.fmt in ("parquet", "arrow"):
+            import pyarrow as pa
+
+            # The first chunk fixes the columns and their types, later chunks are cast to them so the file
+            # stays consistent. pd.read_csv infers the types of every chunk on its own: when a chunk brings a
+            # type the schema cannot hold, the schema is promoted (see promote_type) and the file rewritten.
+            table = pa.Table.from_pandas(chunk if self.schema is None else chunk[self.schema.names], preserve_index=False)
+            fields = [self.storage_field(field) for field in table.schema]
+            if self.writer is None:
+                self.schema = pa.schema(fields, metadata=table.schema.metadata)
+                self.writer = self.open_writer(self.path, self.schema)
+            else:
+                promoted = pa.schema([pa.field(field.name, promote_type(field.type, new.type), field.nullable or new.nullable)
+                                      for field, new in zip(self.schema, fields)], metadata=self.schema.metadata)
+                if not promoted.equals(self.schema):
+                    self.rewrite(promoted)
+            self.writer.write_table(table.cast(self.schema))
+        elif self.fmt == "csv":
+            # Write the header only once, then keep appending
+            chunk.to_csv(self.path, mode='w' if self.first_chunk else 'a', header=self.first_chunk, index=False)
+        else:
+            chunk.to_json(self.path, orient="records", lines=True, mode='w' if self.first_chunk else 'a')
+        self.first_chunk = False
+
+    # Copy the chunks written so far, batch by batch, into a new file with the promoted schema and keep writing
+    # there. The new file replaces the table when the writer is closed.
+    def rewrite(self, schema):
+        import pyarrow as pa
+
+        self.writer.close()
+        old_path = self.current_path
+        reader = None
+        self.promotions += 1
+        self.current_path = f"{self.path}.promote{self.promotions}"
+        self.writer = self.open_writer(self.current_path, schema)
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+            batches = pq.ParquetFile(old_path).iter_batches()
+        else:
+            reader = pa.ipc.open_file(old_path)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        for batch in batches:
+            self.writer.write_table(pa.Table.from_batches([batch]).cast(schema))
+        # Drop the readers of the old file before it is deleted
+        batches = reader = None
+        os.remove(old_path)
+        self.schema = schema
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            if self.current_path != self.path:
+                os.replace(self.current_path, self.path)
+                self.current_path = self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,81 +1,286 @@
 import pymysql
+import pandas as pd
 import csv
+import hashlib
+import itertools
 import os
+import queue
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+
+# The instrumentation is shared by every exercise and lives at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import RUN_ID, file_size, span
+
+# How the CSV file is loaded into raw.job_data_raw:
+#   'batched'   - stream the CSV and insert BATCH_SIZE rows per executemany, committing after every batch,
+#                 so memory and the open transaction stay bounded by the batch size
+#   'load_data' - write the rows that fit the raw table to a temporary file and hand it to LOAD DATA LOCAL INFILE
+#                 (the server needs local_infile=ON)
+#   'single'    - the original load: every row in one list, one executemany and one transaction
+#   'partitioned' - cut the file into RAW_PARTITIONS byte ranges of whole CSV records and load them batched,
+#                 concurrently, each on its own pooled connection. Finding the record boundaries costs one
+#                 CSV parse of the file before the load.
+RAW_LOAD_MODE = 'batched'
+# Mode of from_csv_to_raw, which loads on one connection and so cannot run the partitioned load
+SINGLE_CONNECTION_RAW_LOAD_MODE = 'batched'
+BATCH_SIZE = 10_000
+RAW_PARTITIONS = 4
+
+# Incremental reruns: every posting is fingerprinted (hash of its link and of its link + skills) in
+# raw.job_fingerprint once it reached hist. A run only carries the new or changed postings through
+# raw -> stage -> hist (raw and stage hold the delta of the run), replaces the facts of the changed postings
+# and leaves the rest alone, so rerunning on the same file changes nothing.
+# INCREMENTAL = False appends the whole file on every run, as the pipeline originally did.
+INCREMENTAL = True
+FINGERPRINT_TABLE = "raw.job_fingerprint"
+
+# Connections the pipeline keeps open: the partitioned raw load and the schema setup use several at once
+POOL_SIZE = 4
+
+# How raw.job_data_raw is split into one stage row per skill:
+#   'client' - read the raw table in batches of BATCH_SIZE postings (keyset pagination on raw_id), split, trim
+#              and dedupe every skill of a posting with pandas and insert the pairs into stage in bulk batches
+#   'sql'    - the original INSERT ... SELECT against a numbers table, which only keeps the first 5 skills
+STAGE_MODE = 'client'
+
+# Compare the raw load modes on the CSV file (rows/s of each) before running the pipeline
+COMPARE_RAW_LOADS = False
+
+# Time the stage -> hist join on the VARCHAR(8000) job_link against the join on its hash key after the pipeline
+BENCHMARK_HIST_JOIN = False
+
+# Check hist.skill_job_count against the full dim_skill / job_skill_fact join after the pipeline and rebuild it
+REBUILD_SKILL_JOB_COUNT = False
 
 # 1. MySQL connection setup
-def create_connection(host, user, password, database=None):
+# local_infile=True allows LOAD DATA LOCAL INFILE on this connection
+def create_connection(host, user, password, database=None, local_infile=False):
     connection = pymysql.connect(
         host=host,
         user=user,
         password=password,
         database=database,
-        cursorclass=pymysql.cursors.DictCursor
+        cursorclass=pymysql.cursors.DictCursor,
+        local_infile=local_infile
     )
     return connection
 
+# Fixed set of open connections shared by threads. connection() lends one and takes it back afterwards,
+# waiting while all of them are in use:
+#
+#   with ConnectionPool(4, host=HOST, user=USER, password=PASSWORD) as pool:
+#       with pool.connection() as conn:
+#           ...
+class ConnectionPool:
+    def __init__(self, size, **connection_args):
+        self.size = size
+        self.idle = queue.Queue()
+        for _ in range(size):
+            self.idle.put(create_connection(**connection_args))
+
+    @contextmanager
+    def connection(self):
+        conn = self.idle.get()
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+
+    def close(self):
+        for _ in range(self.size):
+            self.idle.get().close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+# Run function(conn, *args) on a connection lent by the pool
+def run_on_pool(pool, function, *args):
+    with pool.connection() as conn:
+        return function(conn, *args)
+
+# Add a column to an existing table unless it is already there (tables are created with IF NOT EXISTS,
+# so a table made by an earlier version of this script keeps its old columns otherwise)
+def add_column_if_missing(cursor, table, column, definition, position=''):
+    schema, name = table.split('.')
+    cursor.execute(
+        "SELECT COUNT(*) AS found FROM information_schema.columns "
+        "WHERE table_schema = %s AND table_name = %s AND column_name = %s;", (schema, name, column))
+    if not cursor.fetchone()['found']:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition} {position};")
+
+def add_index_if_missing(cursor, table, index, columns):
+    schema, name = table.split('.')
+    cursor.execute(
+        "SELECT COUNT(*) AS found FROM information_schema.statistics "
+        "WHERE table_schema = %s AND table_name = %s AND index_name = %s;", (schema, name, index))
+    if not cursor.fetchone()['found']:
+        cursor.execute(f"CREATE INDEX {index} ON {table} ({columns});")
+
+# Natural keys are VARCHAR(8000), too long to index. Each one gets a fixed width key next to it,
+# <column>_hash = UNHEX(MD5(<column>)) as a stored generated column, with an index on it.
+# Joins and lookups go through the hash and compare the text only on the matching rows.
+def add_hash_key(cursor, table, column):
+    add_column_if_missing(cursor, table, f"{column}_hash", f"BINARY(16) AS (UNHEX(MD5({column}))) STORED")
+    add_index_if_missing(cursor, table, f"idx_{column}_hash", f"{column}_hash")
+
 # 2. Function to create databases and tables with VARCHAR(8000)
-def setup_databases_and_tables(conn):
-    queries = [
-        # Create databases
-        "CREATE DATABASE IF NOT EXISTS raw;",
-        "CREATE DATABASE IF NOT EXISTS stage;",
-        "CREATE DATABASE IF NOT EXISTS hist;",
+DATABASE_QUERIES = [
+    "CREATE DATABASE IF NOT EXISTS raw;",
+    "CREATE DATABASE IF NOT EXISTS stage;",
+    "CREATE DATABASE IF NOT EXISTS hist;",
+]
 
-        # Use the hist database for hist layer table creation
-        "USE hist;",
+HIST_TABLE_QUERIES = {
+    # Create audit log table for triggers
+    'audit_log': """
+    CREATE TABLE IF NOT EXISTS audit_log (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        action VARCHAR(8000),
+        table_name VARCHAR(8000),
+        action_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
 
-        # Create audit log table for triggers
-        """
-        CREATE TABLE IF NOT EXISTS audit_log (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            action VARCHAR(8000),
-            table_name VARCHAR(8000),
-            action_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """,
+    # Create load audit table: one entry per pipeline load step instead of one audit_log row per loaded row
+    'load_audit': """
+    CREATE TABLE IF NOT EXISTS load_audit (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        run_id VARCHAR(32),
+        step VARCHAR(100),
+        table_name VARCHAR(100),
+        action VARCHAR(20),
+        row_count BIGINT,
+        started_at DATETIME(6),
+        finished_at DATETIME(6)
+    );
+    """,
 
-        # Create job_fact table
-        """
-        CREATE TABLE IF NOT EXISTS job_fact (
-            job_id INT AUTO_INCREMENT PRIMARY KEY,
-            job_link VARCHAR(8000)
-        );
-        """,
+    # Create job_fact table
+    'job_fact': """
+    CREATE TABLE IF NOT EXISTS job_fact (
+        job_id INT AUTO_INCREMENT PRIMARY KEY,
+        job_link VARCHAR(8000)
+    );
+    """,
 
-        # Create dim_skill table
-        """
-        CREATE TABLE IF NOT EXISTS dim_skill (
-            skill_id INT AUTO_INCREMENT PRIMARY KEY,
-            skill_name VARCHAR(8000),
-            version INT DEFAULT 1,
-            start_date DATE,
-            end_date DATE DEFAULT NULL,
-            is_active TINYINT(1) DEFAULT 1
-        );
-        """,
+    # Create dim_skill table
+    'dim_skill': """
+    CREATE TABLE IF NOT EXISTS dim_skill (
+        skill_id INT AUTO_INCREMENT PRIMARY KEY,
+        skill_name VARCHAR(8000),
+        version INT DEFAULT 1,
+        start_date DATE,
+        end_date DATE DEFAULT NULL,
+        is_active TINYINT(1) DEFAULT 1
+    );
+    """,
 
-        # Create job_skill_fact table
-        """
-        CREATE TABLE IF NOT EXISTS job_skill_fact (
-            job_id INT,
-            skill_id INT,
-            FOREIGN KEY (job_id) REFERENCES job_fact(job_id),
-            FOREIGN KEY (skill_id) REFERENCES dim_skill(skill_id)
-        );
-        """,
-    ]
+    # Create skill_job_count table: the job count by skill report, kept up to date with the delta of every load
+    'skill_job_count': """
+    CREATE TABLE IF NOT EXISTS skill_job_count (
+        skill_name_hash BINARY(16) PRIMARY KEY,
+        skill_name VARCHAR(8000),
+        job_count BIGINT NOT NULL DEFAULT 0
+    );
+    """,
+}
 
+# Create job_skill_fact table, after the two tables it references
+JOB_SKILL_FACT_QUERY = """
+CREATE TABLE IF NOT EXISTS job_skill_fact (
+    job_id INT,
+    skill_id INT,
+    FOREIGN KEY (job_id) REFERENCES job_fact(job_id),
+    FOREIGN KEY (skill_id) REFERENCES dim_skill(skill_id)
+);
+"""
+
+# Run queries in the hist database (database=None for statements that need no database)
+def run_queries(conn, queries, database='hist'):
     with conn.cursor() as cursor:
+        if database:
+            cursor.execute(f"USE {database};")
         for query in queries:
             cursor.execute(query)
         conn.commit()
 
-    # Move trigger creation here to ensure that the dim_skill table exists first
-    create_triggers(conn)
+def add_job_fact_keys(conn):
+    with conn.cursor() as cursor:
+        add_hash_key(cursor, "hist.job_fact", "job_link")
+        conn.commit()
+
+def add_dim_skill_keys(conn):
+    with conn.cursor() as cursor:
+        add_hash_key(cursor, "hist.dim_skill", "skill_name")
+        conn.commit()
+
+# Both orders of the fact keys: by job for the skills of a posting, by skill for the report and the skill lookups
+def add_job_skill_fact_keys(conn):
+    with conn.cursor() as cursor:
+        add_index_if_missing(cursor, "hist.job_skill_fact", "idx_job_skill", "job_id, skill_id")
+        add_index_if_missing(cursor, "hist.job_skill_fact", "idx_skill_job", "skill_id, job_id")
+        conn.commit()
+
+def create_job_skill_fact(conn):
+    run_queries(conn, [JOB_SKILL_FACT_QUERY])
+    add_job_skill_fact_keys(conn)
+
+# Job count by skill name computed from the facts, what hist.skill_job_count has to hold
+SKILL_JOB_COUNT_QUERY = """
+SELECT d.skill_name_hash, MIN(d.skill_name) AS skill_name, COUNT(f.job_id) AS job_count
+FROM hist.dim_skill d
+JOIN hist.job_skill_fact f ON f.skill_id = d.skill_id
+GROUP BY d.skill_name_hash
+"""
+
+# Add the job counts of newly loaded facts, a Counter of skill_name -> facts, to hist.skill_job_count.
+# The hash is computed here (the same MD5 as UNHEX(MD5(skill_name))): pymysql only turns executemany into one
+# multi-row INSERT when the VALUES clause holds nothing but placeholders.
+def add_skill_job_counts(cursor, counts):
+    cursor.executemany("""
+    INSERT INTO hist.skill_job_count (skill_name_hash, skill_name, job_count)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE job_count = job_count + VALUES(job_count);
+    """, [(hashlib.md5(skill.encode('utf-8')).digest(), skill, count) for skill, count in counts.items()])
+
+# Fill hist.skill_job_count from the facts when it is empty (a new table next to facts loaded before it existed)
+def seed_skill_job_count(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM hist.skill_job_count) AS found;")
+        if not cursor.fetchone()['found']:
+            cursor.execute(f"INSERT INTO hist.skill_job_count (skill_name_hash, skill_name, job_count) {SKILL_JOB_COUNT_QUERY};")
+        conn.commit()
+
+# Create the databases, tables, triggers and stored procedures one step after the other on one connection
+def setup_databases_and_tables(conn):
+    with span("mysql.setup_databases_and_tables"):
+        for wave in SCHEMA_WAVES:
+            for step in wave:
+                step(conn)
+
+# Same schema, every wave spread over the connections of the pool
+def setup_schema(pool):
+    with span("mysql.setup_schema", connections=pool.size):
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            for wave in SCHEMA_WAVES:
+                for future in [executor.submit(run_on_pool, pool, step) for step in wave]:
+                    future.result()
 
 def create_triggers(conn):
     trigger_queries = [
         # Trigger to set start_date to CURDATE() if NULL during insertion in dim_skill
+        "DROP TRIGGER IF EXISTS before_insert_dim_skill;",
         """
         CREATE TRIGGER before_insert_dim_skill
         BEFORE INSERT ON dim_skill
@@ -87,104 +292,442 @@ def create_triggers(conn):
         END;
         """,
 
-        # Create triggers on job_fact for INSERT, UPDATE, DELETE actions
+        # Create triggers on job_fact for INSERT, UPDATE, DELETE actions. They audit single-row changes
+        # (add_new_job, manual edits), pipeline loads set @skip_row_audit and are audited per step (AuditedLoad).
+        # Every trigger is dropped first so a rerun, or an existing database, gets the current bodies.
+        "DROP TRIGGER IF EXISTS after_insert_job_fact;",
         """
         CREATE TRIGGER after_insert_job_fact
         AFTER INSERT ON job_fact
         FOR EACH ROW
         BEGIN
-            INSERT INTO audit_log (action, table_name) VALUES ('INSERT', 'job_fact');
+            IF @skip_row_audit IS NULL THEN
+                INSERT INTO audit_log (action, table_name) VALUES ('INSERT', 'job_fact');
+            END IF;
         END;
         """,
 
+        "DROP TRIGGER IF EXISTS after_update_job_fact;",
         """
         CREATE TRIGGER after_update_job_fact
         AFTER UPDATE ON job_fact
         FOR EACH ROW
         BEGIN
-            INSERT INTO audit_log (action, table_name) VALUES ('UPDATE', 'job_fact');
+            IF @skip_row_audit IS NULL THEN
+                INSERT INTO audit_log (action, table_name) VALUES ('UPDATE', 'job_fact');
+            END IF;
         END;
         """,
 
+        "DROP TRIGGER IF EXISTS after_delete_job_fact;",
         """
         CREATE TRIGGER after_delete_job_fact
         AFTER DELETE ON job_fact
         FOR EACH ROW
         BEGIN
-            INSERT INTO audit_log (action, table_name) VALUES ('DELETE', 'job_fact');
+            IF @skip_row_audit IS NULL THEN
+                INSERT INTO audit_log (action, table_name) VALUES ('DELETE', 'job_fact');
+            END IF;
         END;
         """
     ]
 
+    with span("mysql.create_triggers"):
+        run_queries(conn, trigger_queries)
+
+# Audit of one bulk load step. The row triggers are switched off for the session while the step runs
+# and a single load_audit entry (table, action, rows, start and end time, run id) is written when it succeeds:
+#
+#   with AuditedLoad(conn, "hist.job_fact", "INSERT", "from_stage_to_hist") as load:
+#       ...
+#       load.row_count = cursor.rowcount
+class AuditedLoad:
+    def __init__(self, conn, table_name, action, step):
+        self.conn = conn
+        self.table_name = table_name
+        self.action = action
+        self.step = step
+        self.row_count = None
+
+    def __enter__(self):
+        with self.conn.cursor() as cursor:
+            cursor.execute("SET @skip_row_audit = 1;")
+        self.started_at = datetime.now()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        with self.conn.cursor() as cursor:
+            cursor.execute("SET @skip_row_audit = NULL;")
+            if exc_type is None:
+                cursor.execute(
+                    "INSERT INTO hist.load_audit (run_id, step, table_name, action, row_count, started_at, finished_at) "
+                    "VALUES (%s, %s, %s, %s, %s, %s, %s);",
+                    (RUN_ID, self.step, self.table_name, self.action, self.row_count, self.started_at, datetime.now()))
+                self.conn.commit()
+        return False
+
+# Renamed skills waiting for the SCD Type 2 merge: (skill_name, new_name) pairs, numbered in arrival order
+SKILL_CHANGES_QUERY = """
+CREATE TABLE IF NOT EXISTS stage.skill_changes (
+    change_id INT AUTO_INCREMENT PRIMARY KEY,
+    skill_name VARCHAR(8000),
+    new_name VARCHAR(8000)
+);
+"""
+
+def create_skill_changes_table(conn):
     with conn.cursor() as cursor:
-        for query in trigger_queries:
-            cursor.execute(query)
+        cursor.execute(SKILL_CHANGES_QUERY)
+        # A table created before the changes were numbered gets the column, its pending rows in storage order
+        add_column_if_missing(cursor, "stage.skill_changes", "change_id", "INT AUTO_INCREMENT PRIMARY KEY", "FIRST")
         conn.commit()
 
 # 3. Stored Procedures: SCD Update, Add Job, and Reporting
+# Every procedure is dropped first, so the setup can be rerun and existing databases get the current bodies.
 def setup_stored_procedures(conn):
     procedures = [
-        # SCD Type 2 Update for Skills
+        "DROP PROCEDURE IF EXISTS merge_skill_changes;",
+        "DROP PROCEDURE IF EXISTS update_skill;",
+        "DROP PROCEDURE IF EXISTS add_new_job;",
+        "DROP PROCEDURE IF EXISTS report_job_count_by_skill;",
+
+        # SCD Type 2 merge of every pending rename in stage.skill_changes, in change_id order: a new active
+        # version of the renamed skill, then its old active version is closed. One change at a time, so a chain
+        # of renames in one batch (A -> B, then B -> C) renames the version the previous change inserted.
+        """
+        CREATE PROCEDURE merge_skill_changes()
+        BEGIN
+            DECLARE v_done INT DEFAULT 0;
+            DECLARE v_skill_name VARCHAR(8000);
+            DECLARE v_new_name VARCHAR(8000);
+            DECLARE v_changes CURSOR FOR
+                SELECT skill_name, new_name FROM stage.skill_changes
+                WHERE new_name <> skill_name
+                ORDER BY change_id;
+            DECLARE CONTINUE HANDLER FOR NOT FOUND SET v_done = 1;
+
+            OPEN v_changes;
+            change_loop: LOOP
+                FETCH v_changes INTO v_skill_name, v_new_name;
+                IF v_done THEN
+                    LEAVE change_loop;
+                END IF;
+
+                INSERT INTO dim_skill (skill_name, version, start_date, is_active)
+                SELECT v_new_name, version + 1, CURDATE(), 1
+                FROM dim_skill
+                WHERE skill_name_hash = UNHEX(MD5(v_skill_name)) AND skill_name = v_skill_name AND is_active = 1;
+
+                UPDATE dim_skill
+                SET is_active = 0, end_date = CURDATE()
+                WHERE skill_name_hash = UNHEX(MD5(v_skill_name)) AND skill_name = v_skill_name AND is_active = 1;
+            END LOOP;
+            CLOSE v_changes;
+
+            DELETE FROM stage.skill_changes;
+        END;
+        """,
+
+        # SCD Type 2 Update for one skill, through the same merge
         """
-        CREATE PROCEDURE update_skill(IN skill_name VARCHAR(8000), IN new_name VARCHAR(8000))
+        CREATE PROCEDURE update_skill(IN p_skill_name VARCHAR(8000), IN p_new_name VARCHAR(8000))
         BEGIN
-            -- Deactivate the old skill
-            UPDATE dim_skill
-            SET is_active = 0, end_date = CURDATE()
-            WHERE skill_name = skill_name AND is_active = 1;
-
-            -- Insert the updated skill as a new version
-            INSERT INTO dim_skill (skill_name, version, start_date, is_active)
-            VALUES (new_name, 1, CURDATE(), 1);
+            INSERT INTO stage.skill_changes (skill_name, new_name) VALUES (p_skill_name, p_new_name);
+            CALL merge_skill_changes();
         END;
         """,
 
         # Add New Job and Skills
         """
-        CREATE PROCEDURE add_new_job(IN job_link VARCHAR(8000), IN skill_list TEXT)
+        CREATE PROCEDURE add_new_job(IN p_job_link VARCHAR(8000), IN p_skill_list TEXT)
         BEGIN
+            DECLARE v_job_id INT;
+            DECLARE v_skill_id INT;
+            DECLARE v_skill VARCHAR(8000);
+            DECLARE v_remaining TEXT DEFAULT p_skill_list;
+
             -- Insert into job_fact
-            INSERT INTO job_fact (job_link) VALUES (job_link);
-            SET @job_id = LAST_INSERT_ID();
-            
-            -- Split and insert skills into dim_skill and job_skill_fact
-            SET @skill = '';
-            SET @skills_remaining = skill_list;
-
-            WHILE LENGTH(@skills_remaining) > 0 DO
-                SET @skill = TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(skill_list, ',', numbers.n), ',', -1));
-                SET @skills_remaining = SUBSTRING(@skills_remaining, LENGTH(@skill) + 2);
-                
-                INSERT IGNORE INTO dim_skill (skill_name) VALUES (@skill);
-                SET @skill_id = LAST_INSERT_ID();
-
-                INSERT INTO job_skill_fact (job_id, skill_id) VALUES (@job_id, @skill_id);
+            INSERT INTO job_fact (job_link) VALUES (p_job_link);
+            SET v_job_id = LAST_INSERT_ID();
+
+            -- Take the skills off the front of the list one by one
+            WHILE v_remaining IS NOT NULL AND LENGTH(v_remaining) > 0 DO
+                SET v_skill = TRIM(SUBSTRING_INDEX(v_remaining, ',', 1));
+                IF LOCATE(',', v_remaining) > 0 THEN
+                    SET v_remaining = SUBSTRING(v_remaining, LOCATE(',', v_remaining) + 1);
+                ELSE
+                    SET v_remaining = '';
+                END IF;
+
+                IF v_skill <> '' THEN
+                    -- The active version of the skill, or a new skill
+                    SET v_skill_id = NULL;
+                    SELECT skill_id INTO v_skill_id FROM dim_skill
+                    WHERE skill_name_hash = UNHEX(MD5(v_skill)) AND skill_name = v_skill AND is_active = 1
+                    LIMIT 1;
+                    IF v_skill_id IS NULL THEN
+                        INSERT INTO dim_skill (skill_name) VALUES (v_skill);
+                        SET v_skill_id = LAST_INSERT_ID();
+                    END IF;
+
+                    INSERT INTO job_skill_fact (job_id, skill_id) VALUES (v_job_id, v_skill_id);
+
+                    INSERT INTO skill_job_count (skill_name_hash, skill_name, job_count)
+                    VALUES (UNHEX(MD5(v_skill)), v_skill, 1)
+                    ON DUPLICATE KEY UPDATE job_count = job_count + 1;
+                END IF;
             END WHILE;
         END;
         """,
 
-        # Generate Report: Job Count by Skill
+        # Generate Report: Job Count by Skill, read from the summary kept by the loads
         """
         CREATE PROCEDURE report_job_count_by_skill()
         BEGIN
-            SELECT dim_skill.skill_name, COUNT(job_skill_fact.job_id) AS job_count
-            FROM dim_skill
-            JOIN job_skill_fact ON dim_skill.skill_id = job_skill_fact.skill_id
-            GROUP BY dim_skill.skill_name;
+            SELECT skill_name, job_count
+            FROM skill_job_count
+            WHERE job_count > 0;
         END;
         """
     ]
 
+    with span("mysql.setup_stored_procedures"):
+        run_queries(conn, procedures)
+
+# Every schema step in dependency order. The steps of one wave do not depend on each other: with a pool
+# they run at the same time on separate connections, and a wave starts once the previous one is done.
+SCHEMA_WAVES = [
+    [partial(run_queries, queries=DATABASE_QUERIES, database=None)],
+    [partial(run_queries, queries=[query]) for query in HIST_TABLE_QUERIES.values()]
+    + [create_skill_changes_table, setup_stored_procedures],
+    [add_job_fact_keys, add_dim_skill_keys],
+    [create_job_skill_fact, create_triggers],
+    [seed_skill_job_count],
+]
+
+# 4. Load CSV into the raw table
+RAW_TABLE = "raw.job_data_raw"
+
+# Skill lists longer than the raw column are left out
+MAX_SKILLS_LENGTH = 8000
+
+# Yield (job_link, job_skills) for every row of the CSV file, one row at a time
+def read_job_rows(csv_file_path):
+    with open(csv_file_path, mode='r', encoding='utf-8', errors='ignore') as file:
+        for row in csv.DictReader(file):
+            yield row['job_link'], row['job_skills']
+
+# Keep the first row of every job_link: the file can list a posting more than once, and its fingerprint is kept
+# per link. Loading the other versions too would change the posting again on every incremental run.
+def first_per_link(rows):
+    seen = set()
+    for job_link, job_skills in rows:
+        key = link_hash(job_link)
+        if key not in seen:
+            seen.add(key)
+            yield job_link, job_skills
+
+# The rows a raw load reads: every row, or the first one of every posting for an incremental run
+def job_rows(csv_file_path, incremental=False):
+    rows = read_job_rows(csv_file_path)
+    return first_per_link(rows) if incremental else rows
+
+# Split an iterable into lists of at most batch_size items
+def batches(rows, batch_size):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+# The original load: read every row into a list and insert it in one executemany and one transaction
+# The single and load_data modes load every row, prune_unchanged_raw drops the unchanged ones afterwards
+def load_raw_single(conn, csv_file_path, table=RAW_TABLE, batch_size=None, incremental=False):
+    rows_read = 0
+    rows = []
+    for job_link, job_skills in job_rows(csv_file_path, incremental):
+        rows_read += 1
+        if len(job_skills) <= MAX_SKILLS_LENGTH:
+            rows.append((job_link, job_skills))
+
     with conn.cursor() as cursor:
-        for procedure in procedures:
-            cursor.execute(procedure)
+        cursor.executemany(f"INSERT INTO {table} (job_link, job_skills) VALUES (%s, %s);", rows)
         conn.commit()
+    return rows_read, len(rows)
 
-# 4. Load CSV into the raw table
-def from_csv_to_raw(conn, csv_file_path):
-    # Create raw table
-    create_raw_table_query = """
-    CREATE TABLE IF NOT EXISTS raw.job_data_raw (
+# Fingerprints of a posting, the same bytes as the raw generated columns job_link_hash = UNHEX(MD5(job_link))
+# and content_hash = UNHEX(MD5(CONCAT(job_link, CHAR(31), job_skills))) (utf8mb4 text)
+def link_hash(job_link):
+    return hashlib.md5(job_link.encode('utf-8')).digest()
+
+def content_hash(job_link, job_skills):
+    return hashlib.md5(f"{job_link}\x1f{job_skills}".encode('utf-8')).digest()
+
+# Keep the rows of a batch whose posting is new or whose skills changed since it was last loaded,
+# with one indexed lookup of the batch's links in the fingerprint table
+def changed_rows(conn, batch):
+    hashes = [link_hash(job_link) for job_link, _ in batch]
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"SELECT job_link_hash, content_hash FROM {FINGERPRINT_TABLE} WHERE job_link_hash IN ({', '.join(['%s'] * len(hashes))});",
+            hashes)
+        known = {row['job_link_hash']: row['content_hash'] for row in cursor.fetchall()}
+    return [row for row, key in zip(batch, hashes) if known.get(key) != content_hash(*row)]
+
+# Insert (job_link, job_skills) rows that fit the raw table batch_size rows at a time, committing after every batch.
+# incremental=True skips the postings whose fingerprint is unchanged. Returns the number of rows seen and inserted.
+def insert_raw_rows(conn, rows, table=RAW_TABLE, batch_size=BATCH_SIZE, incremental=False):
+    counts = {'read': 0, 'loaded': 0}
+
+    def fitting_rows():
+        for job_link, job_skills in rows:
+            counts['read'] += 1
+            if len(job_skills) <= MAX_SKILLS_LENGTH:
+                yield job_link, job_skills
+
+    query = f"INSERT INTO {table} (job_link, job_skills) VALUES (%s, %s);"
+    with conn.cursor() as cursor:
+        for batch in batches(fitting_rows(), batch_size):
+            if incremental:
+                batch = changed_rows(conn, batch)
+            if batch:
+                cursor.executemany(query, batch)
+            conn.commit()
+            counts['loaded'] += len(batch)
+    return counts['read'], counts['loaded']
+
+# Stream the CSV file and insert it batch_size rows at a time, committing after every batch
+def load_raw_batched(conn, csv_file_path, table=RAW_TABLE, batch_size=BATCH_SIZE, incremental=False):
+    return insert_raw_rows(conn, job_rows(csv_file_path, incremental), table, batch_size, incremental)
+
+# Cut the CSV file after its header into about `partitions` byte ranges (start, end, rows, skip) of whole records.
+# The file is parsed once to find where records end: a line break inside a quoted field is not a boundary.
+# With unique_links, skip holds the numbers (within the range) of the records that repeat the job_link of an
+# earlier record of the file, see first_per_link. rows is the number of the other records of the range, which
+# the partitioned load checks its reads against.
+def byte_ranges(csv_file_path, partitions, unique_links=False):
+    size = os.path.getsize(csv_file_path)
+    with open(csv_file_path, 'rb') as file:
+        fieldnames = next(csv.reader([file.readline().decode('utf-8', errors='ignore')]))
+        link_column = fieldnames.index('job_link')
+        seen = set()
+        ranges = []
+        start = file.tell()
+        rows = 0
+        number = 0
+        skip = set()
+        targets = [start + (size - start) * number // partitions for number in range(1, partitions)]
+
+        def lines():
+            while True:
+                line = file.readline()
+                if not line:
+                    return
+                yield line.decode('utf-8', errors='ignore')
+
+        # The reader only pulls the lines of the record it returns, so the file position is a record boundary.
+        # Blank lines are records of no field, which csv.DictReader skips: they are not counted.
+        for record in csv.reader(lines()):
+            if record:
+                key = link_hash(record[link_column] if link_column < len(record) else '') if unique_links else None
+                if key in seen:
+                    skip.add(number)
+                else:
+                    rows += 1
+                    if unique_links:
+                        seen.add(key)
+                number += 1
+            position = file.tell()
+            if targets and position >= targets[0] and position < size:
+                ranges.append((start, position, rows, frozenset(skip)))
+                start, rows, number, skip = position, 0, 0, set()
+                while targets and targets[0] <= position:
+                    targets.pop(0)
+        if start < size:
+            ranges.append((start, size, rows, frozenset(skip)))
+    return ranges
+
+# Yield (job_link, job_skills) for the CSV records within [start, end), both record boundaries,
+# but the ones numbered in skip (see byte_ranges)
+def read_job_rows_range(csv_file_path, start, end, skip=frozenset()):
+    with open(csv_file_path, 'rb') as file:
+        fieldnames = next(csv.reader([file.readline().decode('utf-8', errors='ignore')]))
+        file.seek(start)
+
+        def lines():
+            while file.tell() < end:
+                line = file.readline()
+                if not line:
+                    return
+                yield line.decode('utf-8', errors='ignore')
+
+        for number, row in enumerate(csv.DictReader(lines(), fieldnames=fieldnames)):
+            if number not in skip:
+                yield row['job_link'], row['job_skills']
+
+# Load the byte ranges of the CSV file concurrently, each batched on its own pooled connection
+def load_raw_partitioned(pool, csv_file_path, partitions=RAW_PARTITIONS, table=RAW_TABLE, batch_size=BATCH_SIZE,
+                         incremental=False):
+    ranges = byte_ranges(csv_file_path, partitions, unique_links=incremental)
+
+    def load_range(byte_range):
+        start, end, _, skip = byte_range
+        with pool.connection() as conn:
+            return insert_raw_rows(conn, read_job_rows_range(csv_file_path, start, end, skip), table, batch_size,
+                                   incremental)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(pool.size, len(ranges)))) as executor:
+        results = list(executor.map(load_range, ranges))
+
+    # Every range must read back the records the boundary scan counted in it
+    rows_read = sum(read for read, _ in results)
+    expected = sum(rows for _, _, rows, _ in ranges)
+    if rows_read != expected:
+        raise ValueError(f"Partitioned raw load read {rows_read} rows of {csv_file_path}, "
+                         f"the single pass counted {expected}: load the file with the 'batched' mode")
+    return rows_read, sum(loaded for _, loaded in results)
+
+# Write the rows that fit the raw table to a temporary CSV file and bulk load it with LOAD DATA LOCAL INFILE.
+# The connection must be created with local_infile=True.
+def load_raw_load_data(conn, csv_file_path, table=RAW_TABLE, batch_size=None, incremental=False):
+    rows_read = 0
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', newline='', delete=False) as file:
+        temp_path = file.name
+        writer = csv.writer(file, quoting=csv.QUOTE_ALL, lineterminator='\n')
+        for job_link, job_skills in job_rows(csv_file_path, incremental):
+            rows_read += 1
+            if len(job_skills) <= MAX_SKILLS_LENGTH:
+                writer.writerow((job_link, job_skills))
+
+    # csv.writer doubles the quotes inside a field, which is how LOAD DATA reads them with ESCAPED BY ''
+    query = f"""
+    LOAD DATA LOCAL INFILE %s INTO TABLE {table}
+    CHARACTER SET utf8mb4
+    FIELDS TERMINATED BY ',' ENCLOSED BY '"' ESCAPED BY ''
+    LINES TERMINATED BY '\\n'
+    (job_link, job_skills);
+    """
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(query, (temp_path,))
+            rows_loaded = cursor.rowcount
+            conn.commit()
+    finally:
+        os.remove(temp_path)
+    return rows_read, rows_loaded
+
+RAW_LOADERS = {
+    'single': load_raw_single,
+    'batched': load_raw_batched,
+    'load_data': load_raw_load_data,
+}
+
+def create_raw_table(conn, table=RAW_TABLE):
+    # raw_id numbers the postings so the stage step can page through them in order
+    create_raw_table_query = f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        raw_id INT AUTO_INCREMENT PRIMARY KEY,
         job_link VARCHAR(8000),
         job_skills VARCHAR(8000)
     );
@@ -192,34 +735,153 @@ def from_csv_to_raw(conn, csv_file_path):
 
     with conn.cursor() as cursor:
         cursor.execute(create_raw_table_query)
-        conn.commit()
 
-    # with open(csv_file_path, 'r') as file:
+        # A raw table created before raw_id existed gets the column, its rows are numbered in storage order
+        add_column_if_missing(cursor, table, "raw_id", "INT AUTO_INCREMENT PRIMARY KEY", "FIRST")
 
-    with open(csv_file_path, mode='r', encoding='utf-8', errors='ignore') as file:
-        reader = csv.DictReader(file)
-        rows = [(row['job_link'], row['job_skills'])  for row in reader if len(row['job_skills']) <= 8000]
-        
-    query = "INSERT INTO raw.job_data_raw (job_link, job_skills) VALUES (%s, %s);"
-    
+        # Fingerprints of every posting, see link_hash and content_hash
+        add_column_if_missing(cursor, table, "job_link_hash", "BINARY(16) AS (UNHEX(MD5(job_link))) STORED")
+        add_column_if_missing(cursor, table, "content_hash",
+                              "BINARY(16) AS (UNHEX(MD5(CONCAT(job_link, CHAR(31), job_skills)))) STORED")
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {FINGERPRINT_TABLE} (
+            job_link_hash BINARY(16) PRIMARY KEY,
+            content_hash BINARY(16),
+            loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        );
+        """)
+        conn.commit()
+
+# Start an incremental run with an empty raw table, it only receives the delta of this run
+def truncate_raw(conn):
     with conn.cursor() as cursor:
-            cursor.executemany(query, rows)
-            conn.commit()
+        cursor.execute(f"TRUNCATE TABLE {RAW_TABLE};")
+        conn.commit()
 
-# 5. Transfer and Normalize Data from Raw to Stage
-def from_raw_to_stage(conn):
-    # Create stage table
-    create_stage_table_query = """
-    CREATE TABLE IF NOT EXISTS stage.job_data_stage (
-        job_link VARCHAR(8000),
-        skill VARCHAR(8000)
-    );
-    """
+# Drop the raw postings whose fingerprint did not change, whichever way they were loaded
+def prune_unchanged_raw(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+        DELETE r FROM {RAW_TABLE} r
+        JOIN {FINGERPRINT_TABLE} f ON f.job_link_hash = r.job_link_hash AND f.content_hash = r.content_hash;
+        """)
+        pruned = cursor.rowcount
+        conn.commit()
+    return pruned
 
+# Record the fingerprints of the postings of this run, once they reached hist
+def save_fingerprints(conn):
     with conn.cursor() as cursor:
-        cursor.execute(create_stage_table_query)
+        cursor.execute(f"""
+        INSERT INTO {FINGERPRINT_TABLE} (job_link_hash, content_hash)
+        SELECT * FROM (SELECT job_link_hash, content_hash FROM {RAW_TABLE}) AS new
+        ON DUPLICATE KEY UPDATE content_hash = new.content_hash;
+        """)
         conn.commit()
 
+def from_csv_to_raw(conn, csv_file_path, mode=SINGLE_CONNECTION_RAW_LOAD_MODE, batch_size=BATCH_SIZE,
+                    incremental=INCREMENTAL):
+    if mode not in RAW_LOADERS:
+        hint = " (the partitioned load needs a pool, use from_csv_to_raw_partitioned)" if mode == 'partitioned' else ""
+        raise ValueError(f"Unknown raw load mode for from_csv_to_raw: {mode!r}{hint}")
+    with span("mysql.from_csv_to_raw", mode=mode, incremental=incremental) as stage:
+        # Create raw table
+        create_raw_table(conn)
+        if incremental:
+            truncate_raw(conn)
+
+        rows_read, rows_loaded = RAW_LOADERS[mode](conn, csv_file_path, RAW_TABLE, batch_size, incremental)
+        if incremental:
+            rows_loaded -= prune_unchanged_raw(conn)
+
+        stage.rows_in = rows_read
+        stage.rows_out = rows_loaded
+        stage.bytes_read = file_size(csv_file_path)
+    return rows_read, rows_loaded
+
+# Partitioned raw load: the connections of the pool insert the byte ranges of the file at the same time
+def from_csv_to_raw_partitioned(pool, csv_file_path, partitions=RAW_PARTITIONS, batch_size=BATCH_SIZE,
+                                incremental=INCREMENTAL):
+    with span("mysql.from_csv_to_raw", mode='partitioned', partitions=partitions, incremental=incremental) as stage:
+        run_on_pool(pool, create_raw_table)
+        if incremental:
+            run_on_pool(pool, truncate_raw)
+
+        rows_read, rows_loaded = load_raw_partitioned(pool, csv_file_path, partitions, RAW_TABLE, batch_size, incremental)
+        if incremental:
+            rows_loaded -= run_on_pool(pool, prune_unchanged_raw)
+
+        stage.rows_in = rows_read
+        stage.rows_out = rows_loaded
+        stage.bytes_read = file_size(csv_file_path)
+    return rows_read, rows_loaded
+
+# Load the CSV file with every raw load mode into a scratch copy of the raw table and print the rows/s of each
+def compare_raw_loads(host, user, password, csv_file_path, modes=tuple(RAW_LOADERS), batch_size=BATCH_SIZE):
+    scratch_table = "raw.job_data_raw_compare"
+    conn = create_connection(host, user, password, local_infile='load_data' in modes)
+    results = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE DATABASE IF NOT EXISTS raw;")
+        create_raw_table(conn, scratch_table)
+
+        for mode in modes:
+            with conn.cursor() as cursor:
+                cursor.execute(f"TRUNCATE TABLE {scratch_table};")
+
+            start = time.perf_counter()
+            rows_read, rows_loaded = RAW_LOADERS[mode](conn, csv_file_path, scratch_table, batch_size, False)
+            duration = time.perf_counter() - start
+            results.append({'mode': mode, 'rows': rows_loaded, 'duration': duration,
+                            'rows_per_second': rows_loaded / duration if duration > 0 else 0.0})
+            print(f"{mode:<10} {rows_loaded:>10} rows in {duration:>8.2f}s {results[-1]['rows_per_second']:>12.0f} rows/s")
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {scratch_table};")
+        conn.close()
+    return results
+
+# 5. Transfer and Normalize Data from Raw to Stage
+# Yield the raw postings in DataFrames of batch_size rows, paging on raw_id instead of OFFSET
+# so every page is an index range scan
+def read_raw_batches(conn, batch_size=BATCH_SIZE):
+    last_id = 0
+    query = f"SELECT raw_id, job_link, job_skills FROM {RAW_TABLE} WHERE raw_id > %s ORDER BY raw_id LIMIT %s;"
+    while True:
+        with conn.cursor() as cursor:
+            cursor.execute(query, (last_id, batch_size))
+            rows = cursor.fetchall()
+        if not rows:
+            return
+        last_id = rows[-1]['raw_id']
+        yield pd.DataFrame(rows, columns=['raw_id', 'job_link', 'job_skills'])
+
+# One row per (job_link, skill): every comma separated skill of a posting, trimmed,
+# without empty skills and without a skill listed twice for the same posting
+def explode_skills(postings):
+    pairs = postings[['job_link']].assign(skill=postings['job_skills'].str.split(',')).explode('skill')
+    pairs['skill'] = pairs['skill'].str.strip()
+    pairs = pairs[pairs['skill'].notna() & (pairs['skill'] != '')]
+    return pairs.drop_duplicates(['job_link', 'skill'])
+
+# Split the raw postings on the client batch by batch and insert the pairs into stage, committing every batch
+def stage_client_side(conn, batch_size=BATCH_SIZE):
+    postings = 0
+    pairs_loaded = 0
+    query = "INSERT INTO stage.job_data_stage (job_link, skill) VALUES (%s, %s);"
+    for raw in read_raw_batches(conn, batch_size):
+        postings += len(raw)
+        pairs = explode_skills(raw)
+        with conn.cursor() as cursor:
+            for batch in batches(zip(pairs['job_link'], pairs['skill']), batch_size):
+                cursor.executemany(query, batch)
+            conn.commit()
+        pairs_loaded += len(pairs)
+    return postings, pairs_loaded
+
+# The original split in the server, limited to the first 5 skills of every posting
+def stage_sql(conn, batch_size=None):
     # Transform data from raw and insert it into the stage table
     query = """
     INSERT INTO stage.job_data_stage (job_link, skill)
@@ -228,50 +890,253 @@ def from_raw_to_stage(conn):
     JOIN (SELECT 1 n UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4 UNION ALL SELECT 5) numbers
     ON CHAR_LENGTH(job_skills) - CHAR_LENGTH(REPLACE(job_skills, ',', '')) >= numbers.n - 1;
     """
-    
+
     with conn.cursor() as cursor:
         cursor.execute(query)
+        rows = cursor.rowcount
         conn.commit()
+    return None, rows
+
+STAGE_LOADERS = {
+    'client': stage_client_side,
+    'sql': stage_sql,
+}
+
+def from_raw_to_stage(conn, mode=STAGE_MODE, batch_size=BATCH_SIZE, incremental=INCREMENTAL):
+    # Create stage table
+    create_stage_table_query = """
+    CREATE TABLE IF NOT EXISTS stage.job_data_stage (
+        job_link VARCHAR(8000),
+        skill VARCHAR(8000)
+    );
+    """
+
+    with span("mysql.from_raw_to_stage", mode=mode) as stage:
+        with conn.cursor() as cursor:
+            cursor.execute(create_stage_table_query)
+            # stage_id numbers the pairs so the hist step can page through them in order
+            add_column_if_missing(cursor, "stage.job_data_stage", "stage_id", "INT AUTO_INCREMENT PRIMARY KEY", "FIRST")
+            add_hash_key(cursor, "stage.job_data_stage", "job_link")
+            add_hash_key(cursor, "stage.job_data_stage", "skill")
+            # In incremental mode stage only holds the pairs of this run's delta
+            if incremental:
+                cursor.execute("TRUNCATE TABLE stage.job_data_stage;")
+            conn.commit()
+
+        postings, pairs = STAGE_LOADERS[mode](conn, batch_size)
+        stage.rows_in = postings
+        stage.rows_out = pairs
+    return postings, pairs
 
 # 6. Transfer Stage Tables to Hist Layer with Stored Procedure
-def from_stage_to_hist(conn):
+# Insert the skills of stage that dim_skill does not have yet as active skills, in one set-based statement
+def load_dim_skill(conn):
     query = """
-    INSERT INTO hist.job_fact (job_link)
-    SELECT DISTINCT job_link FROM stage.job_data_stage;
+    INSERT INTO hist.dim_skill (skill_name)
+    SELECT MIN(s.skill)
+    FROM stage.job_data_stage s
+    LEFT JOIN hist.dim_skill d ON d.skill_name_hash = s.skill_hash AND d.skill_name = s.skill AND d.is_active = 1
+    WHERE d.skill_id IS NULL AND s.skill <> ''
+    GROUP BY s.skill_hash;
     """
+    with span("mysql.load_dim_skill") as stage, AuditedLoad(conn, "hist.dim_skill", "INSERT", "load_dim_skill") as load:
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+            stage.rows_out = load.row_count = cursor.rowcount
+            conn.commit()
+
+# skill_name -> skill_id of every active skill, read once per run so facts are keyed without a lookup per row
+def load_skill_cache(conn):
     with conn.cursor() as cursor:
-        cursor.execute(query)
+        cursor.execute("SELECT skill_id, skill_name FROM hist.dim_skill WHERE is_active = 1;")
+        return {row['skill_name']: row['skill_id'] for row in cursor.fetchall()}
 
+# The skill cache, reloaded once when the stage rows hold a skill it does not have (a skill made active
+# since it was read). A skill still missing after that is a bug in the dim_skill load and raises ValueError:
+# its facts would silently be left out of hist.
+def skill_ids_for(conn, skill_ids, rows):
+    if all(row['skill'] in skill_ids for row in rows):
+        return skill_ids
+    skill_ids = load_skill_cache(conn)
+    missing = sorted({row['skill'] for row in rows if row['skill'] not in skill_ids})
+    if missing:
+        raise ValueError(f"{len(missing)} stage skills have no active row in hist.dim_skill, "
+                         f"e.g. {missing[:5]}: their facts cannot be loaded")
+    return skill_ids
+
+# Yield the stage pairs with the job_id of their posting, batch_size pairs at a time (keyset pagination on stage_id)
+def read_stage_batches(conn, batch_size=BATCH_SIZE):
+    last_id = 0
     query = """
-    INSERT INTO hist.job_skill_fact (job_id, skill_id)
-    SELECT j.job_id, s.skill_id
-    FROM hist.job_fact j
-    JOIN stage.job_data_stage s ON j.job_link = s.job_link;
+    SELECT s.stage_id, j.job_id, s.skill
+    FROM stage.job_data_stage s
+    JOIN hist.job_fact j ON j.job_link_hash = s.job_link_hash AND j.job_link = s.job_link
+    WHERE s.stage_id > %s
+    ORDER BY s.stage_id
+    LIMIT %s;
     """
-    with conn.cursor() as cursor:
-        cursor.execute(query)
-        conn.commit()
+    while True:
+        with conn.cursor() as cursor:
+            cursor.execute(query, (last_id, batch_size))
+            rows = cursor.fetchall()
+        if not rows:
+            return
+        last_id = rows[-1]['stage_id']
+        yield rows
+
+# Joins on the natural keys match the indexed hash keys first and compare the VARCHAR(8000) text only on those rows
+def from_stage_to_hist(conn, batch_size=BATCH_SIZE, incremental=INCREMENTAL):
+    with span("mysql.from_stage_to_hist", incremental=incremental) as stage:
+        # Only the job links hist does not know yet get a job_id
+        query = """
+        INSERT INTO hist.job_fact (job_link)
+        SELECT MIN(s.job_link) FROM stage.job_data_stage s
+        LEFT JOIN hist.job_fact j ON j.job_link_hash = s.job_link_hash AND j.job_link = s.job_link
+        WHERE j.job_id IS NULL
+        GROUP BY s.job_link_hash;
+        """
+        with AuditedLoad(conn, "hist.job_fact", "INSERT", "from_stage_to_hist") as load:
+            with conn.cursor() as cursor:
+                cursor.execute(query)
+                jobs = load.row_count = cursor.rowcount
+                conn.commit()
+
+        # A changed posting gets its skills replaced: the old facts of every posting of this run (raw holds
+        # only the delta) go before the new ones are inserted, also when none of its new skills reached stage
+        # Their counts come off hist.skill_job_count in the same transaction
+        if incremental:
+            postings = f"""
+            hist.job_skill_fact f
+            JOIN hist.job_fact j ON j.job_id = f.job_id
+            JOIN (SELECT DISTINCT job_link_hash, job_link FROM {RAW_TABLE}) r
+            ON r.job_link_hash = j.job_link_hash AND r.job_link = j.job_link
+            """
+            with AuditedLoad(conn, "hist.job_skill_fact", "DELETE", "from_stage_to_hist") as load:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"""
+                    UPDATE hist.skill_job_count c
+                    JOIN (
+                        SELECT d.skill_name_hash, COUNT(*) AS removed
+                        FROM {postings}
+                        JOIN hist.dim_skill d ON d.skill_id = f.skill_id
+                        GROUP BY d.skill_name_hash
+                    ) x ON x.skill_name_hash = c.skill_name_hash
+                    SET c.job_count = c.job_count - x.removed;
+                    """)
+                    cursor.execute("DELETE FROM hist.skill_job_count WHERE job_count <= 0;")
+                    cursor.execute(f"DELETE f FROM {postings};")
+                    load.row_count = cursor.rowcount
+                    conn.commit()
+
+        load_dim_skill(conn)
+        skill_ids = load_skill_cache(conn)
+
+        # The facts get their skill_id from the cache and go in bulk, one executemany and commit per batch,
+        # together with the job counts they add to hist.skill_job_count
+        facts = 0
+        query = "INSERT INTO hist.job_skill_fact (job_id, skill_id) VALUES (%s, %s);"
+        with AuditedLoad(conn, "hist.job_skill_fact", "INSERT", "from_stage_to_hist") as load:
+            for rows in read_stage_batches(conn, batch_size):
+                # Empty skills never reach dim_skill (see load_dim_skill), every other skill must be in the cache
+                rows = [row for row in rows if row['skill'] != '']
+                skill_ids = skill_ids_for(conn, skill_ids, rows)
+                batch = [(row['job_id'], skill_ids[row['skill']]) for row in rows]
+                with conn.cursor() as cursor:
+                    cursor.executemany(query, batch)
+                    add_skill_job_counts(cursor, Counter(row['skill'] for row in rows))
+                    conn.commit()
+                facts += len(batch)
+            load.row_count = facts
+
+        # The postings of this run are in hist, the next run skips them until they change
+        if incremental:
+            save_fingerprints(conn)
+
+        stage.rows_out = jobs + facts
+
+# Apply a list of (skill_name, new_name) renames as SCD Type 2 versions, in one bulk insert and one merge
+def apply_skill_changes(conn, changes):
+    with span("mysql.apply_skill_changes") as stage:
+        with conn.cursor() as cursor:
+            cursor.executemany("INSERT INTO stage.skill_changes (skill_name, new_name) VALUES (%s, %s);", changes)
+            cursor.execute("CALL hist.merge_skill_changes();")
+            conn.commit()
+        stage.rows_in = len(changes)
+
+# Compare hist.skill_job_count with the full fact join, print the skills whose count is off and rebuild the table
+# from the join in one transaction. Returns the number of skills that were off.
+def rebuild_skill_job_count(conn):
+    with span("mysql.rebuild_skill_job_count") as stage:
+        with conn.cursor() as cursor:
+            cursor.execute(SKILL_JOB_COUNT_QUERY + ";")
+            expected = {row['skill_name_hash']: (row['skill_name'], row['job_count']) for row in cursor.fetchall()}
+            cursor.execute("SELECT skill_name_hash, skill_name, job_count FROM hist.skill_job_count WHERE job_count > 0;")
+            current = {row['skill_name_hash']: (row['skill_name'], row['job_count']) for row in cursor.fetchall()}
+
+            mismatches = 0
+            for key in expected.keys() | current.keys():
+                if expected.get(key, (None, 0))[1] != current.get(key, (None, 0))[1]:
+                    mismatches += 1
+                    name = (expected.get(key) or current.get(key))[0]
+                    print(f"{name}: {current.get(key, (None, 0))[1]} in skill_job_count, {expected.get(key, (None, 0))[1]} in the facts")
+            print(f"skill_job_count: {mismatches} of {len(expected)} skills differed from the facts, rebuilding")
+
+            cursor.execute("DELETE FROM hist.skill_job_count;")
+            cursor.execute(f"INSERT INTO hist.skill_job_count (skill_name_hash, skill_name, job_count) {SKILL_JOB_COUNT_QUERY};")
+            conn.commit()
+        stage.rows_out = len(expected)
+    return mismatches
+
+# Time the stage -> hist join on the job_link text, as the hist load did before the hash keys, and on the hash key
+def benchmark_hist_join(conn):
+    queries = {
+        'job_link': """
+            SELECT COUNT(*) AS matches FROM stage.job_data_stage s
+            JOIN hist.job_fact j ON j.job_link = s.job_link;
+            """,
+        'job_link_hash': """
+            SELECT COUNT(*) AS matches FROM stage.job_data_stage s
+            JOIN hist.job_fact j ON j.job_link_hash = s.job_link_hash AND j.job_link = s.job_link;
+            """,
+    }
+    results = {}
+    for key, query in queries.items():
+        with conn.cursor() as cursor:
+            start = time.perf_counter()
+            cursor.execute(query)
+            matches = cursor.fetchone()['matches']
+            results[key] = time.perf_counter() - start
+        print(f"Join on {key:<14} {matches:>10} rows in {results[key]:>8.3f}s")
+    return results
 
 # 7. Full ETL Pipeline
-def full_etl_pipeline(host, user, password, csv_file_path):
-    # Step 1: Create a connection without specifying a database
-    conn = create_connection(host, user, password)
+def full_etl_pipeline(host, user, password, csv_file_path, raw_load_mode=RAW_LOAD_MODE, stage_mode=STAGE_MODE,
+                      pool_size=POOL_SIZE, incremental=INCREMENTAL):
+    with span("mysql.full_etl_pipeline", connections=pool_size, incremental=incremental):
+        # Step 1: Open a pool of connections without specifying a database
+        with ConnectionPool(pool_size, host=host, user=user, password=password,
+                            local_infile=raw_load_mode == 'load_data') as pool:
+            # Step 2: Set up the databases, tables, triggers and stored procedures, independent steps concurrently
+            setup_schema(pool)
 
-    # Step 2: Set up the databases, tables, and stored procedures
-    setup_databases_and_tables(conn)
-    setup_stored_procedures(conn)
+            # Step 3: Load CSV data into the raw table
+            if raw_load_mode == 'partitioned':
+                from_csv_to_raw_partitioned(pool, csv_file_path, incremental=incremental)
+            else:
+                run_on_pool(pool, from_csv_to_raw, csv_file_path, raw_load_mode, BATCH_SIZE, incremental)
 
-    # Step 3: Load CSV data into the raw table
-    from_csv_to_raw(conn, csv_file_path)
+            with pool.connection() as conn:
+                # Step 4: Transform and move data to the stage table
+                from_raw_to_stage(conn, stage_mode, incremental=incremental)
 
-    # Step 4: Transform and move data to the stage table
-    from_raw_to_stage(conn)
+                # Step 5: Move data from stage to hist
+                from_stage_to_hist(conn, incremental=incremental)
 
-    # Step 5: Move data from stage to hist
-    from_stage_to_hist(conn)
+                if BENCHMARK_HIST_JOIN:
+                    benchmark_hist_join(conn)
 
-    # Close the connection
-    conn.close()
+                if REBUILD_SKILL_JOB_COUNT:
+                    rebuild_skill_job_count(conn)
 
 # Example usage:
 if __name__ == "__main__":
@@ -291,6 +1156,9 @@ if __name__ == "__main__":
     CSV_FILE_PATH = os.path.join(script_path, csv_filename)
     
     print("Path of the file is :", CSV_FILE_PATH)
+
+    if COMPARE_RAW_LOADS:
+        compare_raw_loads(HOST, USER, PASSWORD, CSV_FILE_PATH)
     
     # Run the ETL pipeline
     full_etl_pipeline(HOST, USER, PASSWORD, CSV_FILE_PATH)
@@ -1,40 +1,263 @@
+import hashlib
+import itertools
 import json
-from pymongo import MongoClient
-from datetime import datetime
+import os
+import sys
+import time
+from pymongo import MongoClient, UpdateOne
+from datetime import datetime, timezone
+from functools import partial
+
+# The instrumentation is shared by every exercise and lives at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import file_size, span
 
 # Step 1: Connect to MongoDB
 # Establish a connection to MongoDB running locally. 
 # You can modify the connection string if using MongoDB Atlas or a different MongoDB server.
-client = MongoClient("mongodb://localhost:27017/")  # Modify if using MongoDB Atlas
-db = client['news_category_db']  # Create or connect to the database named 'news_category_db'
+# MONGO_URI and MONGO_DATABASE override both, the benchmark uses them to load a scratch database.
+MONGO_URI = os.environ.get('MONGO_URI', "mongodb://localhost:27017/")  # Modify if using MongoDB Atlas
+MONGO_DATABASE = os.environ.get('MONGO_DATABASE', 'news_category_db')
+client = MongoClient(MONGO_URI)
+db = client[MONGO_DATABASE]  # Create or connect to the database, 'news_category_db' by default
+
+# Documents per insert_many: one round trip per batch instead of one per article, memory bounded by the batch
+INSERT_BATCH_SIZE = 5_000
+
+# How the files are written to their collection:
+#   'upsert' - every article gets a natural key _nk (hash of link, headline and date) with a unique index and is
+#              written with a bulk upsert that only sets its fields when the key is new, so a rerun adds nothing.
+#              A byte offset checkpoint per file lets an interrupted load resume after its last written batch.
+#   'insert' - insert_many every article, every run appends the whole file again
+INGEST_MODE = 'upsert'
+CHECKPOINT_COLLECTION = "ingest_checkpoints"
+
+# Compare the keyword views on the text index with the original regex scans (documents examined, time)
+BENCHMARK_KEYWORD_VIEWS = False
+
+# Also load the files with the original one insert_one per line path (into a scratch collection) to compare docs/s
+COMPARE_INGEST = False
 
 
 # Step 2: Load JSON Data and Insert into MongoDB
 # Define a function to load data from a specified JSON file and insert it into a collection.
 # Each entry in the JSON file is a news article containing fields like 'headline', 'category', 'authors', etc.
-def insert_data(filename, collection_name):
-    try:
-        # Attempt to load the file as a JSON array
-        with open(filename, 'r') as file:
-            data = json.load(file)  # Load JSON data as an array of objects
-            for entry in data:
-                # Convert date to datetime object if available
-                entry['date'] = datetime.strptime(entry['date'], '%Y-%m-%d') if entry.get('date') else None
-            db[collection_name].insert_many(data)  # Insert all entries as a batch
-
-    except json.JSONDecodeError:
-        # If loading as an array fails, try line-by-line parsing
-        print("JSON array load failed. Attempting line-by-line parsing.")
-        with open(filename, 'r') as file:
-            for line in file:
-                try:
-                    entry = json.loads(line.strip())  # Load each line as an individual JSON object
+
+# 'array' for a file holding one JSON array, 'lines' for JSON Lines (one object per line, like the News Category
+# dataset), told from the first character that is not whitespace
+def detect_format(filename):
+    with open(filename, 'r', encoding='utf-8') as file:
+        while True:
+            char = file.read(1)
+            if not char or not char.isspace():
+                return 'array' if char == '[' else 'lines'
+
+# Convert date to datetime object if available
+def parse_entry(entry):
+    entry['date'] = datetime.strptime(entry['date'], '%Y-%m-%d') if entry.get('date') else None
+    return entry
+
+# Yield (entry, offset) for the entries of the file one at a time, offset being the byte offset just past the
+# entry's line. A JSON Lines file is parsed line by line as it is read, from start_offset on.
+# A JSON array is loaded whole and its entries have no offset (None).
+def read_entries(filename, file_format, start_offset=0):
+    if file_format == 'array':
+        with open(filename, 'r', encoding='utf-8') as file:
+            # Load JSON data as an array of objects
+            for entry in json.load(file):
+                yield parse_entry(entry), None
+        return
+
+    with open(filename, 'rb') as file:
+        file.seek(start_offset)
+        offset = start_offset
+        for raw_line in file:
+            offset += len(raw_line)
+            line = raw_line.decode('utf-8').strip()
+            if not line:
+                continue
+            try:
+                yield parse_entry(json.loads(line)), offset  # Load each line as an individual JSON object
+            except json.JSONDecodeError as e:
+                print(f"Error decoding JSON on line: {line}\nError: {e}")
+
+# Split an iterable into lists of at most batch_size items
+def batches(items, batch_size):
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+# Insert the file into the collection in insert_many batches of batch_size documents.
+# ordered=False lets the server insert a batch without stopping at the first failing document.
+def insert_data(filename, collection_name, batch_size=INSERT_BATCH_SIZE):
+    file_format = detect_format(filename)
+    with span("mongodb.insert_data", collection=collection_name, format=file_format, batch_size=batch_size) as stage:
+        start = time.perf_counter()
+        inserted = 0
+        for batch in batches(read_entries(filename, file_format), batch_size):
+            ingested_at = datetime.now(timezone.utc)
+            db[collection_name].insert_many([dict(entry, _ingested_at=ingested_at) for entry, _ in batch], ordered=False)
+            inserted += len(batch)
+        duration = time.perf_counter() - start
+
+        stage.rows_out = inserted
+        stage.bytes_read = file_size(filename)
+    report_ingest(collection_name, inserted, duration, f"insert_many of {batch_size}")
+    return inserted, duration
+
+# Natural key of an article: the same link, headline and date always give the same key
+def natural_key(entry):
+    date = entry['date'].strftime('%Y-%m-%d') if entry.get('date') else ''
+    return hashlib.md5(f"{entry.get('link', '')}\x1f{entry.get('headline', '')}\x1f{date}".encode('utf-8')).hexdigest()
+
+# Give the documents loaded without a natural key (by the 'insert' mode) their _nk, then keep the oldest
+# document of every key and delete the other copies, so the unique index can be built and the upserts match
+# them. The views materialized from the deleted copies are rebuilt in full on the next refresh.
+# Returns the number of documents keyed and deleted.
+def backfill_natural_keys(collection_name, batch_size=INSERT_BATCH_SIZE):
+    collection = db[collection_name]
+    if collection.find_one({'_nk': {'$exists': False}}, {'_id': 1}) is None:
+        return 0, 0
+    # A copy of a keyed document would break the unique index while it is keyed, the index is built again after
+    if '_nk_1' in collection.index_information():
+        collection.drop_index('_nk_1')
+
+    keyed = 0
+    unkeyed = collection.find({'_nk': {'$exists': False}}, {'link': 1, 'headline': 1, 'date': 1})
+    for batch in batches(unkeyed, batch_size):
+        collection.bulk_write([UpdateOne({'_id': document['_id']}, {'$set': {'_nk': natural_key(document)}})
+                               for document in batch], ordered=False)
+        keyed += len(batch)
+
+    # ObjectIds grow with the insert time, the smallest _id of a key is its oldest copy
+    copies = collection.aggregate([
+        {'$group': {'_id': '$_nk', 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+    ], allowDiskUse=True)
+    deleted = 0
+    extra_ids = (extra_id for group in copies for extra_id in sorted(group['ids'])[1:])
+    for batch in batches(extra_ids, batch_size):
+        deleted += collection.delete_many({'_id': {'$in': batch}}).deleted_count
+    if deleted:
+        db[REFRESH_STATE_COLLECTION].delete_one({'_id': collection_name})
+    print(f"{collection_name}: natural key added to {keyed} documents, {deleted} duplicates deleted")
+    return keyed, deleted
+
+# Unique index on the natural key. Documents without _nk are left out of it, backfill_natural_keys gives them one.
+def create_natural_key_index(collection_name):
+    db[collection_name].create_index([("_nk", 1)], unique=True, partialFilterExpression={'_nk': {'$exists': True}})
+
+# Where the load of filename into collection_name stopped. A checkpoint only counts for the same file
+# (size and modification time), a changed file is read again from the start and the upserts skip what is there.
+def read_checkpoint(filename, collection_name):
+    stat = os.stat(filename)
+    checkpoint = db[CHECKPOINT_COLLECTION].find_one({'_id': f"{collection_name}:{os.path.basename(filename)}"})
+    if checkpoint and checkpoint['size'] == stat.st_size and checkpoint['mtime'] == stat.st_mtime:
+        return checkpoint['offset']
+    return 0
+
+def save_checkpoint(filename, collection_name, offset):
+    stat = os.stat(filename)
+    db[CHECKPOINT_COLLECTION].update_one(
+        {'_id': f"{collection_name}:{os.path.basename(filename)}"},
+        {'$set': {'offset': offset, 'size': stat.st_size, 'mtime': stat.st_mtime, 'updated_at': datetime.now(timezone.utc)}},
+        upsert=True)
+
+# Write the file to the collection with bulk upserts on the natural key, batch_size documents per bulk_write.
+# After every batch the checkpoint moves past its last line, a rerun on an unchanged, fully loaded file
+# reads and writes nothing.
+def upsert_data(filename, collection_name, batch_size=INSERT_BATCH_SIZE):
+    file_format = detect_format(filename)
+    start_offset = read_checkpoint(filename, collection_name)
+    with span("mongodb.upsert_data", collection=collection_name, format=file_format, batch_size=batch_size,
+              start_offset=start_offset) as stage:
+        start = time.perf_counter()
+        backfill_natural_keys(collection_name, batch_size)
+        create_natural_key_index(collection_name)
+
+        read = 0
+        upserted = 0
+        if start_offset < os.path.getsize(filename):
+            for batch in batches(read_entries(filename, file_format, start_offset), batch_size):
+                # _ingested_at is only set on new articles, it drives the refresh of the materialized views.
+                # It is in UTC: a local time goes back an hour when daylight saving time ends.
+                ingested_at = datetime.now(timezone.utc)
+                requests = [UpdateOne({'_nk': natural_key(entry)}, {'$setOnInsert': dict(entry, _ingested_at=ingested_at)},
+                                      upsert=True)
+                            for entry, _ in batch]
+                result = db[collection_name].bulk_write(requests, ordered=False)
+                read += len(batch)
+                upserted += result.upserted_count
+                if batch[-1][1] is not None:
+                    save_checkpoint(filename, collection_name, batch[-1][1])
+            save_checkpoint(filename, collection_name, os.path.getsize(filename))
+        duration = time.perf_counter() - start
+
+        stage.rows_in = read
+        stage.rows_out = upserted
+        stage.bytes_read = os.path.getsize(filename) - start_offset
+    print(f"{collection_name}: {read} documents read from byte {start_offset}, {upserted} new")
+    report_ingest(collection_name, read, duration, f"upserts of {batch_size}")
+    return upserted, duration
+
+INGEST_LOADERS = {
+    'upsert': upsert_data,
+    'insert': insert_data,
+}
+
+# The original load: try the file as a JSON array and fall back to one insert_one per line.
+# Kept to compare its docs/s with insert_data.
+def insert_data_legacy(filename, collection_name):
+    with span("mongodb.insert_data_legacy", collection=collection_name) as stage:
+        start = time.perf_counter()
+        inserted = 0
+        try:
+            # Attempt to load the file as a JSON array
+            with open(filename, 'r') as file:
+                data = json.load(file)  # Load JSON data as an array of objects
+                for entry in data:
                     # Convert date to datetime object if available
                     entry['date'] = datetime.strptime(entry['date'], '%Y-%m-%d') if entry.get('date') else None
-                    db[collection_name].insert_one(entry)  # Insert each entry one at a time
-                except json.JSONDecodeError as e:
-                    print(f"Error decoding JSON on line: {line}\nError: {e}")
-
+                db[collection_name].insert_many(data)  # Insert all entries as a batch
+                inserted = len(data)
+
+        except json.JSONDecodeError:
+            # If loading as an array fails, try line-by-line parsing
+            print("JSON array load failed. Attempting line-by-line parsing.")
+            with open(filename, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line.strip())  # Load each line as an individual JSON object
+                        # Convert date to datetime object if available
+                        entry['date'] = datetime.strptime(entry['date'], '%Y-%m-%d') if entry.get('date') else None
+                        db[collection_name].insert_one(entry)  # Insert each entry one at a time
+                        inserted += 1
+                    except json.JSONDecodeError as e:
+                        print(f"Error decoding JSON on line: {line}\nError: {e}")
+        duration = time.perf_counter() - start
+
+        stage.rows_out = inserted
+        stage.bytes_read = file_size(filename)
+    report_ingest(collection_name, inserted, duration, "legacy")
+    return inserted, duration
+
+# Print how many documents a load inserted and its docs/s
+def report_ingest(collection_name, inserted, duration, method):
+    rate = inserted / duration if duration > 0 else 0.0
+    print(f"{collection_name}: {inserted} documents in {duration:.2f}s with {method}, {rate:.0f} docs/s")
+
+# Load the file with both paths into a scratch collection, dropped afterwards, and print the docs/s of each
+def compare_ingest(filename, batch_size=INSERT_BATCH_SIZE):
+    scratch = "ingest_compare"
+    try:
+        for load in (insert_data_legacy, partial(insert_data, batch_size=batch_size)):
+            db.drop_collection(scratch)
+            load(filename, scratch)
+    finally:
+        db.drop_collection(scratch)
 
 
 # Specify the filename and collection mapping for inserting data
@@ -42,93 +265,218 @@ files_collections = {
     'News_Category_Dataset_v3.json': 'news'  # Example file: collection mapping
 }
 
-# Load and insert each file into the respective collection
-for file, collection in files_collections.items():
-    insert_data(file, collection)
-
 
 # Step 3: Define Filtered Views
 # Define a series of "views" that apply various filters to the data.
 # Each view uses the aggregation pipeline in MongoDB to filter data based on different criteria.
-def create_filter_views():
+# They are created as named MongoDB views on the news collection: a consumer reads them like a collection.
+FILTER_VIEWS = {
     # View 1: Filter articles in the 'ENTERTAINMENT' category
     # This retrieves only articles where the 'category' field is set to 'ENTERTAINMENT'.
-    view1 = db.news.aggregate([{'$match': {'category': 'ENTERTAINMENT'}}])
+    'entertainment_articles': [{'$match': {'category': 'ENTERTAINMENT'}}],
 
     # View 2: Filter articles published between 2018 and 2022
     # Retrieves articles with a 'date' field between January 1, 2018, and December 31, 2022.
-    view2 = db.news.aggregate([{'$match': {'date': {'$gte': datetime(2018, 1, 1), '$lte': datetime(2022, 12, 31)}}}])
+    'articles_2018_2022': [{'$match': {'date': {'$gte': datetime(2018, 1, 1), '$lte': datetime(2022, 12, 31)}}}],
 
     # View 3: Filter articles with headline length greater than 80 characters
     # Uses $expr and $strLenCP to calculate the length of the 'headline' field and apply the filter.
-    view3 = db.news.aggregate([{'$match': {'$expr': {'$gt': [{'$strLenCP': "$headline"}, 80]}}}])
+    'long_headline_articles': [{'$match': {'$expr': {'$gt': [{'$strLenCP': "$headline"}, 80]}}}],
+}
 
+# Views 4 to 6 search keywords. An unanchored case-insensitive $regex cannot use a B-tree index, so they go
+# through the text index on headline, short_description and authors (see create_indexes): $text picks the
+# candidate articles from the index and the original regex, applied to those only, keeps the exact meaning
+# (the right field, the case-insensitive match). The text index matches whole words and their stems, a keyword
+# inside a longer word is not found. $text cannot be used in a MongoDB view, so every run writes the articles of
+# each one, most relevant first, to a collection of its name (see create_keyword_views).
+KEYWORD_VIEWS = {
     # View 4: Filter articles with specific keywords in the short_description
-    # Uses a regular expression to search for keywords like 'COVID' or 'pandemic' in the 'short_description' field.
-    view4 = db.news.aggregate([{'$match': {'short_description': {'$regex': 'COVID|pandemic', '$options': 'i'}}}])
+    # Searches for either keyword, 'COVID' or 'pandemic', and keeps the articles with one in the 'short_description' field.
+    'covid_articles': {'search': 'COVID pandemic', 'field': 'short_description', 'regex': 'COVID|pandemic'},
 
     # View 5: Filter articles authored by a specific author, e.g., "John Doe"
-    # Uses a case-insensitive regular expression to match authors in the 'authors' field.
-    view5 = db.news.aggregate([{'$match': {'authors': {'$regex': 'John Doe', '$options': 'i'}}}])
+    # Searches for the phrase and keeps the articles where it is in the 'authors' field.
+    'john_doe_articles': {'search': '"John Doe"', 'field': 'authors', 'regex': 'John Doe'},
 
     # View 6: Filter articles with "Election" in the headline (case-insensitive)
-    # Matches headlines that contain the word "Election", ignoring case.
-    view6 = db.news.aggregate([{'$match': {'headline': {'$regex': 'Election', '$options': 'i'}}}])
+    # Searches for the word and keeps the articles where it is in the headline.
+    'election_articles': {'search': 'Election', 'field': 'headline', 'regex': 'Election'},
+}
+
+# The original filter of a keyword view: a regex over the whole collection
+def regex_filter(name):
+    view = KEYWORD_VIEWS[name]
+    return {view['field']: {'$regex': view['regex'], '$options': 'i'}}
+
+# The filter of a keyword view on the text index
+def keyword_filter(name):
+    return dict(regex_filter(name), **{'$text': {'$search': KEYWORD_VIEWS[name]['search']}})
+
+# Pipeline of a keyword view: its articles ranked by text score, which the weights of the text index drive
+# (a match in the headline counts most), kept in the relevance field
+def keyword_view(name):
+    return [
+        {'$match': keyword_filter(name)},
+        {'$addFields': {'relevance': {'$meta': 'textScore'}}},
+        {'$sort': {'relevance': {'$meta': 'textScore'}}},
+    ]
+
+# Create (or replace) a named view of the news collection
+def create_view(name, pipeline):
+    db.drop_collection(name)
+    db.create_collection(name, viewOn='news', pipeline=pipeline)
+    return db[name]
 
-    return [view1, view2, view3, view4, view5, view6]  # Return all views for further use
+def create_filter_views():
+    # Named views of the keyword views created by earlier runs would still scan the collection, and $out
+    # cannot replace a view (see create_keyword_views)
+    for name in KEYWORD_VIEWS:
+        db.drop_collection(name)
+    return [create_view(name, pipeline) for name, pipeline in FILTER_VIEWS.items()]  # Return all views for further use
 
 
 # Step 4: Define Aggregation Views
 # Define a series of aggregation views for summarizing or transforming data.
-def create_aggregation_views():
+AGGREGATION_VIEWS = {
     # Aggregation View 1: Count articles per category
     # Groups documents by 'category' and counts the number of articles in each category.
-    agg_view1 = db.news.aggregate([
+    'articles_per_category': [
         {'$group': {'_id': "$category", 'count': {'$sum': 1}}}
-    ])
+    ],
 
     # Aggregation View 2: Average short_description length per category
     # Calculates the average length of 'short_description' field in each category.
-    agg_view2 = db.news.aggregate([
+    'description_length_per_category': [
         {'$addFields': {'desc_length': {'$strLenCP': "$short_description"}}},
         {'$group': {'_id': "$category", 'average_desc_length': {'$avg': "$desc_length"}}}
-    ])
+    ],
 
     # Aggregation View 3: Count of articles per author
     # Groups documents by 'authors' and counts the number of articles for each author.
-    agg_view3 = db.news.aggregate([
+    'articles_per_author': [
         {'$group': {'_id': "$authors", 'count': {'$sum': 1}}}
-    ])
+    ],
 
     # Aggregation View 4: Most frequent words in headlines
     # Splits headlines into individual words, then counts occurrences of each word and sorts by frequency.
-    agg_view4 = db.news.aggregate([
+    'top_headline_words': [
         {'$project': {'words': {'$split': ["$headline", " "]}}},
         {'$unwind': '$words'},
         {'$group': {'_id': '$words', 'count': {'$sum': 1}}},
         {'$sort': {'count': -1}},
         {'$limit': 10}  # Limit to top 10 most frequent words
-    ])
+    ],
 
     # Aggregation View 5: Monthly count of articles
     # Groups documents by year and month of publication date, then counts articles for each period.
-    agg_view5 = db.news.aggregate([
+    'articles_per_month': [
         {'$project': {'year_month': {'$dateToString': {'format': "%Y-%m", 'date': "$date"}}}},
         {'$group': {'_id': "$year_month", 'count': {'$sum': 1}}},
         {'$sort': {'_id': 1}}  # Sort by date ascending
-    ])
+    ],
 
     # Aggregation View 6: Earliest and latest publication date per category
     # Finds the earliest and latest date of publication for each category.
-    agg_view6 = db.news.aggregate([
+    'date_range_per_category': [
         {'$group': {
             '_id': "$category",
             'first_date': {'$min': "$date"},
             'last_date': {'$max': "$date"}
         }}
-    ])
+    ],
+}
 
-    return [agg_view1, agg_view2, agg_view3, agg_view4, agg_view5, agg_view6]  # Return all aggregations
+def create_aggregation_views():
+    return [create_view(name, pipeline) for name, pipeline in AGGREGATION_VIEWS.items()]  # Return all aggregations
+
+# Write the articles of every keyword view to a collection of its name, replaced on every run.
+# Needs the text index (see create_indexes).
+def create_keyword_views():
+    for name in KEYWORD_VIEWS:
+        db.news.aggregate(keyword_view(name) + [{'$out': name}])
+    return [db[name] for name in KEYWORD_VIEWS]
+
+
+# Step 4b: Materialize the Aggregation Views
+# The grouped views are also stored in mv_<view> collections, one document per group, so reading them is not a
+# scan of news. A refresh recomputes only the groups that gained articles since the last refresh: the new
+# articles are found by their _ingested_at, their category, author and month (from their date) are the affected
+# groups, and only the articles of those groups are aggregated again and $merge'd over the old group documents.
+# View -> the field its groups are keyed by ('month' is the year and month of the date)
+MATERIALIZED_VIEWS = {
+    'articles_per_category': 'category',
+    'description_length_per_category': 'category',
+    'articles_per_author': 'authors',
+    'articles_per_month': 'month',
+    'date_range_per_category': 'category',
+}
+REFRESH_STATE_COLLECTION = "view_refresh_state"
+
+# The articles of the affected groups, None means every article
+def affected_match(group_field, groups):
+    if groups is None:
+        return {}
+    if group_field != 'month':
+        return {group_field: {'$in': groups}}
+
+    ranges = []
+    for month in groups:
+        if month is None:
+            ranges.append({'date': None})
+            continue
+        first = datetime.strptime(month, '%Y-%m')
+        following = datetime(first.year + first.month // 12, first.month % 12 + 1, 1)
+        ranges.append({'date': {'$gte': first, '$lt': following}})
+    return {'$or': ranges}
+
+# Aggregate the articles of the given groups (all of them when groups is None) into mv_<name>
+def materialize_view(name, groups=None):
+    group_field = MATERIALIZED_VIEWS[name]
+    if groups is not None and not groups:
+        return
+    pipeline = [stage for stage in AGGREGATION_VIEWS[name] if '$sort' not in stage]
+    db.news.aggregate(
+        [{'$match': affected_match(group_field, groups)}] + pipeline
+        + [{'$merge': {'into': f"mv_{name}", 'on': '_id', 'whenMatched': 'replace', 'whenNotMatched': 'insert'}}]
+    )
+
+# Bring every materialized view up to date. The first refresh builds them from the whole collection,
+# later ones only touch the groups of the articles ingested after the previous refresh.
+def refresh_materialized_views():
+    state = db[REFRESH_STATE_COLLECTION].find_one({'_id': 'news'})
+    watermark = state['ingested_at'] if state else None
+
+    with span("mongodb.refresh_materialized_views", full=watermark is None) as stage:
+        if watermark is None:
+            # Articles loaded before _ingested_at existed have none, the refreshes stay full until some have one
+            latest = next(db.news.aggregate([{'$group': {'_id': None, 'last': {'$max': '$_ingested_at'}}}]), None)
+            last = latest['last'] if latest else None
+            for name in MATERIALIZED_VIEWS:
+                db.drop_collection(f"mv_{name}")
+                materialize_view(name)
+        else:
+            # One pass over the new articles only (index on _ingested_at) collects the affected groups
+            new = next(db.news.aggregate([
+                {'$match': {'_ingested_at': {'$gt': watermark}}},
+                {'$group': {
+                    '_id': None,
+                    'articles': {'$sum': 1},
+                    'category': {'$addToSet': '$category'},
+                    'authors': {'$addToSet': '$authors'},
+                    'month': {'$addToSet': {'$dateToString': {'format': "%Y-%m", 'date': "$date"}}},
+                    'last': {'$max': '$_ingested_at'},
+                }},
+            ]), None)
+            last = watermark
+            if new:
+                for name, group_field in MATERIALIZED_VIEWS.items():
+                    materialize_view(name, new[group_field])
+                last = new['last']
+                stage.rows_in = new['articles']
+
+        if last is not None:
+            db[REFRESH_STATE_COLLECTION].update_one({'_id': 'news'}, {'$set': {'ingested_at': last}}, upsert=True)
 
 
 # Step 5: Define Indexes to Optimize Queries
@@ -152,17 +500,58 @@ def create_indexes():
     # Compound index on 'category' and 'date' to optimize searches by category and date range
     db.news.create_index([("category", 1), ("date", 1)])
 
+    # Index on '_ingested_at' so a view refresh finds the new articles without a scan
+    db.news.create_index([("_ingested_at", 1)])
+
+    # Text index for the keyword views, a match in the headline weighs most, then the description, then the authors
+    db.news.create_index(
+        [("headline", "text"), ("short_description", "text"), ("authors", "text")],
+        weights={'headline': 10, 'short_description': 5, 'authors': 2},
+        name="news_keyword_search",
+    )
+
+
+# Step 6: Compare the Keyword Views with the Regex Scans
+# Explain every keyword view with its original regex filter and with the text index, and print what each examined
+def benchmark_keyword_views():
+    results = {}
+    for name in KEYWORD_VIEWS:
+        for method, query in (('regex', regex_filter(name)), ('text', keyword_filter(name))):
+            stats = db.news.find(query).explain()['executionStats']
+            results[(name, method)] = stats
+            print(f"{name:<20} {method:<6} {stats['totalDocsExamined']:>10} documents examined "
+                  f"{stats['nReturned']:>8} returned {stats['executionTimeMillis']:>8} ms")
+    return results
+
 
 # Execute the Script
 # Load data, create views, and set up indexes.
+if COMPARE_INGEST:
+    for file in files_collections:
+        compare_ingest(file)
+
 for file, collection in files_collections.items():
-    insert_data(file, collection)
+    INGEST_LOADERS[INGEST_MODE](file, collection)
 
 # Create filter views
-create_filter_views()
+with span("mongodb.create_filter_views"):
+    create_filter_views()
 
 # Create aggregation views
-create_aggregation_views()
+with span("mongodb.create_aggregation_views"):
+    create_aggregation_views()
 
 # Create indexes
-create_indexes()
+with span("mongodb.create_indexes"):
+    create_indexes()
+
+# Create the keyword views on the text index
+with span("mongodb.create_keyword_views"):
+    create_keyword_views()
+
+if BENCHMARK_KEYWORD_VIEWS:
+    with span("mongodb.benchmark_keyword_views"):
+        benchmark_keyword_views()
+
+# Refresh the materialized aggregation views with the articles loaded since the last refresh
+refresh_materialized_views()
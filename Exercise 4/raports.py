@@ -1,5 +1,7 @@
 import pandas as pd
+import numpy as np
 import os 
+import sys
 import seaborn as sns
 import matplotlib.pyplot as plt
 
@@ -9,16 +11,27 @@ import matplotlib.pyplot as plt
 script_path = os.path.dirname(os.path.abspath(__file__))
 
 
-# Load the previously saved CSV files From Exercise 1 Folder Gold
-top_rated_products = pd.read_csv(os.path.join(os.path.dirname(script_path), "Exercise 1", "Gold", "amazon-top-rated-products.csv"))
-low_rated_products = pd.read_csv(os.path.join(os.path.dirname(script_path), "Exercise 1", "Gold", "amazon-low-rated-products.csv"))
-popularity_vs_satisfaction = pd.read_csv(os.path.join(os.path.dirname(script_path), "Exercise 1", "Gold", "amazon-popularity-vs-satisfaction.csv"))
-yearly_avg_score = pd.read_csv(os.path.join(os.path.dirname(script_path), "Exercise 1", "Gold", "amazon-product-improvements-over-time.csv"))
-top_reviewers = pd.read_csv(os.path.join(os.path.dirname(script_path), "Exercise 1", "Gold", "amazon-top-reviewers.csv"))
-monthly_trends = pd.read_csv(os.path.join(os.path.dirname(script_path), "Exercise 1", "Gold", "amazon-seasonal-popularity.csv"))
-user_avg_score = pd.read_csv(os.path.join(os.path.dirname(script_path), "Exercise 1", "Gold", "amazon-consistency-in-user-ratings.csv"))
-helpfulness_analysis = pd.read_csv(os.path.join(os.path.dirname(script_path), "Exercise 1", "Gold", "amazon-helpfulness-ratio-analysis.csv"))
-yearly_trends = pd.read_csv(os.path.join(os.path.dirname(script_path), "Exercise 1", "Gold", "amazon-trend-analysis-over-time.csv"))
+# The storage layer lives in the Exercise 1 folder
+sys.path.insert(0, os.path.join(os.path.dirname(script_path), "Exercise 1"))
+from storage import read_table, table_path
+
+gold_path = os.path.join(os.path.dirname(script_path), "Exercise 1", "Gold")
+
+# The popularity table holds one score histogram per product, how many reviews gave each score from 1 to 5
+SCORES = [1, 2, 3, 4, 5]
+SCORE_COLUMNS = [f'score_{score}' for score in SCORES]
+
+# Load the previously saved Gold tables From Exercise 1 Folder Gold.
+# Only the columns the charts below use are read from disk.
+top_rated_products = read_table(table_path(gold_path, "amazon-top-rated-products"), columns=['ProductId', 'Score'])
+low_rated_products = read_table(table_path(gold_path, "amazon-low-rated-products"), columns=['ProductId', 'Year', 'Score'])
+popularity_vs_satisfaction = read_table(table_path(gold_path, "amazon-popularity-vs-satisfaction"), columns=['ProductId', 'num_reviews'] + SCORE_COLUMNS)
+yearly_avg_score = read_table(table_path(gold_path, "amazon-product-improvements-over-time"), columns=['Year', 'Score'])
+top_reviewers = read_table(table_path(gold_path, "amazon-top-reviewers-topk"), columns=['UserId', 'num_reviews', 'max_error'])
+monthly_trends = read_table(table_path(gold_path, "amazon-seasonal-popularity"), columns=['Month', 'num_reviews'])
+user_avg_score = read_table(table_path(gold_path, "amazon-consistency-in-user-ratings"), columns=['UserId', 'user_avg_score', 'bias'])
+helpfulness_analysis = read_table(table_path(gold_path, "amazon-helpfulness-ratio-analysis"), columns=['UserId', 'Year', 'helpfulness_ratio'])
+yearly_trends = read_table(table_path(gold_path, "amazon-trend-analysis-over-time"), columns=['Year', 'num_reviews'])
 
 
 # 1. Line Plots
@@ -88,6 +101,7 @@ def bar_chart_top_reviewers(df):
     """
     Bar Chart showing the top reviewers by number of reviews.
     This visualizes who the most active reviewers are within the dataset.
+    The counts come from the streaming top-K sketch, each one is at most max_error above the true count.
     """
     plt.figure(figsize=(10, 6))
     sns.barplot(data=df.head(10), x='UserId', y='num_reviews', ci=None)
@@ -120,9 +134,9 @@ def pie_chart_top_products(df):
     Pie Chart showing the proportion of top-rated products.
     This visualizes how many of the total reviews belong to the top-rated products.
     """
-    top_products = df['ProductId'].value_counts().head(10)
+    top_products = df.nlargest(10, 'num_reviews')
     plt.figure(figsize=(8, 8))
-    plt.pie(top_products, labels=top_products.index, autopct='%1.1f%%', startangle=140)
+    plt.pie(top_products['num_reviews'], labels=top_products['ProductId'], autopct='%1.1f%%', startangle=140)
     plt.title('Top Products by Number of Reviews')
     plt.axis('equal')
     plt.savefig("amazon-pie-chart-top-products.png")
@@ -156,15 +170,46 @@ def pie_chart_helpfulness_distribution(df):
 
 # 4. Other Chart Types
 
+def histogram_percentile(counts, percentile):
+    """
+    Percentile of the scores described by a histogram (counts[i] reviews with score SCORES[i]),
+    interpolated the same way as numpy.percentile would on the individual scores.
+    """
+    cumulative = np.cumsum(counts)
+    position = percentile / 100 * (cumulative[-1] - 1)
+    lower = SCORES[np.searchsorted(cumulative, np.floor(position), side='right')]
+    upper = SCORES[np.searchsorted(cumulative, np.ceil(position), side='right')]
+    return lower + (upper - lower) * (position - np.floor(position))
+
+def histogram_box_stats(counts):
+    """
+    Box plot statistics (as matplotlib.cbook.boxplot_stats computes them) of the scores described by a histogram.
+    """
+    q1, median, q3 = (histogram_percentile(counts, percentile) for percentile in (25, 50, 75))
+    iqr = q3 - q1
+    present = [score for score, count in zip(SCORES, counts) if count > 0]
+
+    # Whiskers reach the furthest score within 1.5 IQR of the box, but never end inside the box
+    whislo = min([score for score in present if score >= q1 - 1.5 * iqr] + [q1])
+    whishi = max([score for score in present if score <= q3 + 1.5 * iqr] + [q3])
+    return {
+        'med': median, 'q1': q1, 'q3': q3,
+        'whislo': whislo, 'whishi': whishi,
+        'fliers': [score for score in present if score < whislo or score > whishi],
+    }
+
 def box_plot_score_distribution(df):
     """
     Box Plot showing the distribution of scores.
     This visualizes the spread and outliers of review scores, highlighting any significant ratings.
+    The box is drawn from the summed score histograms of all products instead of one row per review.
     """
+    counts = df[SCORE_COLUMNS].sum().to_numpy()
     plt.figure(figsize=(10, 6))
-    sns.boxplot(data=df, x='Score')
+    plt.gca().bxp([histogram_box_stats(counts)], showfliers=True)
+    plt.gca().set_xticks([])
     plt.title('Distribution of Review Scores')
-    plt.xlabel('Score')
+    plt.ylabel('Score')
     plt.savefig("amazon-box-plot-score-distribution.png")
     plt.show()
 
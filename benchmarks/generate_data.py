@@ -0,0 +1,161 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Seeded synthetic generators for every input file of the exercises.
+# The real files are not in the repository, these match the columns the code reads.
+# scale = 1 gives BASE_ROWS rows per dataset, the same seed and scale always give the same files.
+BASE_ROWS = {
+    'amazon': 100_000,
+    'iowa': 100_000,
+    'swiggy': 10_000,
+    'jobs': 20_000,
+    'news': 50_000,
+}
+
+SWIGGY_CITIES = ['Abohar', 'Agra', 'Ahmedabad', 'Bangalore', 'Chennai', 'Delhi', 'Hyderabad', 'Kolkata',
+                 'Mumbai', 'Pune', 'Wardha', 'Washim', 'Wayanad', 'Zirakpur']
+NEWS_CATEGORIES = ['POLITICS', 'WELLNESS', 'ENTERTAINMENT', 'TRAVEL', 'STYLE & BEAUTY', 'PARENTING',
+                   'HEALTHY LIVING', 'QUEER VOICES', 'FOOD & DRINK', 'BUSINESS', 'COMEDY', 'SPORTS']
+WORDS = ['election', 'covid', 'pandemic', 'market', 'health', 'travel', 'music', 'film', 'vote', 'school',
+         'climate', 'food', 'family', 'city', 'police', 'court', 'game', 'science', 'money', 'house']
+SKILLS = ['python', 'sql', 'communication', 'teamwork', 'excel', 'java', 'leadership', 'customer service',
+          'project management', 'machine learning', 'aws', 'docker', 'sales', 'accounting', 'nursing',
+          'scheduling', 'problem solving', 'data analysis', 'marketing', 'forklift']
+
+
+def rows_for(dataset, scale):
+    return max(1, int(BASE_ROWS[dataset] * scale))
+
+
+# Random sentences of `length` words
+def sentences(rng, count, length):
+    words = np.array(WORDS)[rng.integers(0, len(WORDS), size=(count, length))]
+    return [' '.join(row) for row in words]
+
+
+# Bronze/amazon-fine-food-reviews.csv. IDs follow a Zipf law so a few products and reviewers dominate.
+# start_time shifts the review times, used to generate a later delta of new reviews.
+def amazon_reviews(rows, seed=0, start_id=1, start_time=946684800):
+    rng = np.random.default_rng(seed)
+    denominator = rng.integers(0, 20, rows)
+    return pd.DataFrame({
+        'Id': np.arange(start_id, start_id + rows),
+        'ProductId': ['B%09d' % i for i in rng.zipf(1.3, rows) % max(1, rows // 5)],
+        'UserId': ['A%012d' % i for i in rng.zipf(1.4, rows) % max(1, rows // 3)],
+        'ProfileName': ['user %d' % i for i in rng.integers(0, 1000, rows)],
+        'HelpfulnessNumerator': (denominator * rng.random(rows)).astype('int64'),
+        'HelpfulnessDenominator': denominator,
+        'Score': rng.choice([1, 2, 3, 4, 5], rows, p=[0.09, 0.05, 0.08, 0.14, 0.64]),
+        'Time': start_time + rng.integers(0, 12 * 365, rows) * 86400,
+        'Summary': sentences(rng, rows, 3),
+        'Text': sentences(rng, rows, 20),
+    })
+
+
+# Bronze/Iowa_Liquor_Sales.csv, with the Pack column the Bronze -> Silver job drops and some nulls
+def iowa_sales(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    bottles = rng.integers(1, 48, rows)
+    retail = rng.uniform(3, 60, rows).round(2)
+    store = rng.integers(2000, 6000, rows)
+    data = pd.DataFrame({
+        'Invoice/Item Number': ['INV-%08d' % i for i in range(rows)],
+        'Date': pd.to_datetime(rng.integers(1_325_376_000, 1_704_067_200, rows), unit='s').strftime('%m/%d/%Y'),
+        'Store Number': store,
+        'Store Name': ['Store %d' % i for i in store],
+        'City': rng.choice(['DES MOINES', 'CEDAR RAPIDS', 'DAVENPORT', 'SIOUX CITY', 'IOWA CITY'], rows),
+        'Zip Code': rng.integers(50000, 52999, rows),
+        'County': rng.choice(['POLK', 'LINN', 'SCOTT', 'WOODBURY', 'JOHNSON'], rows),
+        'Category Name': rng.choice(['VODKA', 'WHISKIES', 'RUM', 'TEQUILA', 'GIN'], rows),
+        'Vendor Number': rng.integers(1, 500, rows),
+        'Item Number': rng.integers(10000, 99999, rows),
+        'Item Description': ['Item %d' % i for i in rng.integers(0, 5000, rows)],
+        'Pack': rng.choice([6, 12, 24, 48], rows),
+        'Bottle Volume (ml)': rng.choice([375, 750, 1000, 1750], rows),
+        'State Bottle Retail': retail,
+        'Bottles Sold': bottles,
+        'Sale (Dollars)': (bottles * retail).round(2),
+    })
+    # About 2% of the rows miss a value somewhere, the null filter drops them
+    data.loc[rng.random(rows) < 0.02, 'County'] = None
+    # Like the real file, a few Zip Codes late in the file are not numbers, so a chunked read infers int64 for
+    # the first chunks and strings for a later one
+    late_rows = data.index >= rows * 3 // 4
+    data['Zip Code'] = data['Zip Code'].astype(object)
+    data.loc[late_rows & (rng.random(rows) < 0.01), 'Zip Code'] = '712-2'
+    return data
+
+
+# Bronze/swiggy-restaurants-dataset.json: one object keyed by city, each with its link and restaurants by id
+def swiggy_restaurants(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    cities = rng.choice(SWIGGY_CITIES, rows)
+    document = {city: {'link': f"https://www.swiggy.com/city/{city.lower()}", 'restaurants': {}} for city in SWIGGY_CITIES}
+    for number, city in enumerate(cities):
+        document[city]['restaurants'][str(100000 + number)] = {
+            'name': f"Restaurant {number}",
+            'rating': str(round(rng.uniform(2.5, 5.0), 1)) if rng.random() > 0.1 else '--',
+            'rating_count': rng.choice(['Too Few Ratings', '20+ ratings', '100+ ratings', '1K+ ratings']),
+            'cost': f"₹ {int(rng.integers(100, 1000))}",
+            'address': f"{int(rng.integers(1, 500))} Main Road, {city}",
+            'cuisine': ','.join(rng.choice(['North Indian', 'Chinese', 'South Indian', 'Biryani', 'Pizzas'], 2)),
+            'lic_no': str(int(rng.integers(10 ** 13, 10 ** 14))),
+            'link': f"https://www.swiggy.com/restaurants/{number}",
+            'menu': {f"Item {item}": {'price': str(int(rng.integers(50, 500))), 'veg_or_non_veg': 'Veg'} for item in range(3)},
+        }
+    return document
+
+
+# Exercise 2/job-skills.csv: a job link and its comma separated skills (some postings list dozens)
+def job_skills(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    counts = np.minimum(rng.geometric(0.12, rows), 60)
+    skills = [', '.join(rng.choice(SKILLS, count)) for count in counts]
+    return pd.DataFrame({
+        'job_link': ['https://www.linkedin.com/jobs/view/job-%d' % i for i in range(rows)],
+        'job_skills': skills,
+    })
+
+
+# Exercise 3/News_Category_Dataset_v3.json: JSON lines, one article per line
+def news_articles(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    authors = np.array(['John Doe', 'Jane Roe', 'Ed Mazza', 'Carla K. Johnson', 'Reuters', ''])
+    return pd.DataFrame({
+        'link': ['https://www.huffpost.com/entry/article-%d' % i for i in range(rows)],
+        'headline': [sentence.capitalize() for sentence in sentences(rng, rows, 12)],
+        'category': rng.choice(NEWS_CATEGORIES, rows),
+        'short_description': sentences(rng, rows, 25),
+        'authors': authors[rng.integers(0, len(authors), rows)],
+        'date': pd.to_datetime(rng.integers(1_333_238_400, 1_664_582_400, rows), unit='s').strftime('%Y-%m-%d'),
+    })
+
+
+# Write every input file for one scale factor under data_dir, in the layout the exercises expect
+def generate_all(data_dir, scale, seed=0):
+    for folder in ("Bronze", "Silver", "Gold"):
+        os.makedirs(os.path.join(data_dir, folder), exist_ok=True)
+
+    paths = {
+        'amazon': os.path.join(data_dir, "Bronze", "amazon-fine-food-reviews.csv"),
+        'iowa': os.path.join(data_dir, "Bronze", "Iowa_Liquor_Sales.csv"),
+        'swiggy': os.path.join(data_dir, "Bronze", "swiggy-restaurants-dataset.json"),
+        'jobs': os.path.join(data_dir, "job-skills.csv"),
+        'news': os.path.join(data_dir, "News_Category_Dataset_v3.json"),
+    }
+    amazon_reviews(rows_for('amazon', scale), seed).to_csv(paths['amazon'], index=False)
+    iowa_sales(rows_for('iowa', scale), seed).to_csv(paths['iowa'], index=False)
+    with open(paths['swiggy'], 'w', encoding='utf-8') as file:
+        json.dump(swiggy_restaurants(rows_for('swiggy', scale), seed), file)
+    job_skills(rows_for('jobs', scale), seed).to_csv(paths['jobs'], index=False)
+    news_articles(rows_for('news', scale), seed).to_json(paths['news'], orient='records', lines=True)
+    return paths
+
+
+if __name__ == "__main__":
+    # python generate_data.py <data_dir> [scale]
+    generate_all(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else 1.0)
@@ -0,0 +1,331 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import pandas as pd
+
+# Benchmark of every pipeline stage on synthetic data at several scale factors.
+#
+#   python benchmarks/run_benchmarks.py                      # scales 0.1 and 1, results in benchmarks/results
+#   python benchmarks/run_benchmarks.py --scales 1 10 --repeat 3
+#   python benchmarks/run_benchmarks.py --compare OLD.json NEW.json
+#
+# Every stage runs in a fresh process, so its peak memory is its own and not the one of an earlier stage.
+# The MySQL stage only runs when BENCH_MYSQL_HOST is set (with BENCH_MYSQL_USER and BENCH_MYSQL_PASSWORD),
+# the MongoDB stage only when BENCH_MONGO is set, since both need a running server. Both start every run from
+# empty data: the MySQL stage drops the raw, stage and hist databases of that server, so point it at a scratch
+# server. BENCH_MONGO is a connection string, its database (BENCH_MONGO_DEFAULT_DATABASE when it names none) is
+# dropped and loaded instead of the script's own.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+
+# The benchmarks folder, the repository root (instrumentation, imported by the pipeline modules) and the exercises
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+for folder in ("Exercise 1", os.path.join("Exercise 1", "BronzeToSilver"), os.path.join("Exercise 1", "SilverToGold"), "Exercise 2"):
+    sys.path.insert(0, os.path.join(REPO_DIR, folder))
+
+from generate_data import amazon_reviews, generate_all
+from instrumentation import peak_rss_mb
+
+# Size of the delta appended to the Silver reviews for the incremental Gold stage, as a share of the rows
+DELTA_SHARE = 0.01
+
+# Fewest chunks the streaming Bronze -> Silver CSV stages read their file in
+BRONZE_MIN_CHUNKS = 4
+
+# Database of the MongoDB stage when BENCH_MONGO does not name one
+BENCH_MONGO_DEFAULT_DATABASE = "news_category_bench"
+
+# Memory budget of the out-of-core Gold stage, small enough for the synthetic files to be partitioned
+OUT_OF_CORE_BUDGET_MB = 16
+
+
+def silver_reviews(data_dir):
+    from storage import table_path
+    return table_path(os.path.join(data_dir, "Silver"), "amazon-fine-food-reviews")
+
+
+# Empty Gold folder of one stage, so every run starts from scratch
+def fresh_gold_dir(data_dir, name):
+    gold_dir = os.path.join(data_dir, "Gold", name)
+    shutil.rmtree(gold_dir, ignore_errors=True)
+    os.makedirs(gold_dir)
+    return gold_dir
+
+
+def count_lines(path):
+    with open(path, 'rb') as file:
+        return sum(1 for _ in file)
+
+
+# Stage functions. Each one runs the stage on the files under data_dir and returns the number of rows it processed.
+
+# CSV datasets are read in at least BRONZE_MIN_CHUNKS chunks, so the streaming path writes several chunks even
+# at small scales and meets the type drift of the generated Iowa file (see generate_data.iowa_sales)
+def bronze_to_silver(data_dir, dataset):
+    from bronze_to_silver import DATASETS, run_dataset
+    spec = DATASETS[dataset]
+    if spec['format'] == 'csv' and spec.get('chunk_size'):
+        rows = count_lines(os.path.join(data_dir, "Bronze", spec['source'])) - 1
+        spec = {**spec, 'chunk_size': max(1, min(spec['chunk_size'], rows // BRONZE_MIN_CHUNKS))}
+    return run_dataset(dataset, spec, data_dir)['rows_in']
+
+
+def gold_full(data_dir):
+    from amazonSilverToGold import silver_to_gold
+    from storage import count_rows
+    silver_to_gold(silver_reviews(data_dir), fresh_gold_dir(data_dir, "full"), incremental=False, out_of_core=False)
+    return count_rows(silver_reviews(data_dir))
+
+
+def gold_out_of_core(data_dir):
+    from amazonSilverToGold import silver_to_gold
+    from storage import count_rows
+    silver_to_gold(silver_reviews(data_dir), fresh_gold_dir(data_dir, "out_of_core"), incremental=False,
+                   out_of_core=True, memory_budget_mb=OUT_OF_CORE_BUDGET_MB)
+    return count_rows(silver_reviews(data_dir))
+
+
+# Setup of the incremental stage: build the Gold state from the Silver reviews, then append newer reviews
+# to a copy of the Silver file. Returns the number of new reviews.
+def gold_incremental_setup(data_dir):
+    from amazonSilverToGold import silver_to_gold
+    from storage import read_table, write_table
+    silver_file = silver_reviews(data_dir)
+    incremental_file = os.path.join(os.path.dirname(silver_file), "incremental-" + os.path.basename(silver_file))
+    gold_dir = fresh_gold_dir(data_dir, "incremental")
+
+    silver = read_table(silver_file)
+    shutil.copyfile(silver_file, incremental_file)
+    silver_to_gold(incremental_file, gold_dir, incremental=True, out_of_core=False)
+
+    delta = amazon_reviews(max(1, int(len(silver) * DELTA_SHARE)), seed=1, start_id=int(silver['Id'].max()) + 1,
+                           start_time=int(silver['Time'].max()) + 86400).drop(columns=['Text'])
+    write_table(pd.concat([silver, delta], ignore_index=True), incremental_file)
+    return len(delta)
+
+
+def gold_incremental(data_dir):
+    from amazonSilverToGold import silver_to_gold
+    from storage import count_rows
+    silver_file = silver_reviews(data_dir)
+    incremental_file = os.path.join(os.path.dirname(silver_file), "incremental-" + os.path.basename(silver_file))
+    silver_to_gold(incremental_file, os.path.join(data_dir, "Gold", "incremental"), incremental=True, out_of_core=False)
+    return count_rows(incremental_file) - count_rows(silver_file)
+
+
+def top_k(data_dir):
+    from heavy_hitters import refresh_top_k
+    from storage import count_rows
+    gold_dir = fresh_gold_dir(data_dir, "top_k")
+    refresh_top_k(silver_reviews(data_dir), gold_dir, os.path.join(gold_dir, "_state"))
+    return count_rows(silver_reviews(data_dir))
+
+
+def mysql_credentials():
+    return (os.environ['BENCH_MYSQL_HOST'], os.environ.get('BENCH_MYSQL_USER', 'root'),
+            os.environ.get('BENCH_MYSQL_PASSWORD', ''))
+
+
+# Setup of the MySQL stage: drop the databases of the pipeline, so no run finds the postings of an earlier one
+def mysql_etl_setup(data_dir):
+    from creatingTheDatabases import create_connection
+    conn = create_connection(*mysql_credentials())
+    try:
+        with conn.cursor() as cursor:
+            for database in ("hist", "stage", "raw"):
+                cursor.execute(f"DROP DATABASE IF EXISTS {database};")
+    finally:
+        conn.close()
+    return 0
+
+
+# A full load, the incremental mode would skip the postings of a database loaded before
+def mysql_etl(data_dir):
+    from creatingTheDatabases import full_etl_pipeline
+    full_etl_pipeline(*mysql_credentials(), os.path.join(data_dir, "job-skills.csv"), incremental=False)
+    return count_lines(os.path.join(data_dir, "job-skills.csv")) - 1
+
+
+# Connection string and database of the MongoDB stage, never the script's own news_category_db
+def mongo_target():
+    from pymongo import uri_parser
+    uri = os.environ['BENCH_MONGO']
+    database = uri_parser.parse_uri(uri)['database'] or BENCH_MONGO_DEFAULT_DATABASE
+    if database == "news_category_db":
+        raise ValueError(f"BENCH_MONGO names the database of the MongoDB script ({database}), use a scratch database")
+    return uri, database
+
+
+# Setup of the MongoDB stage: drop the scratch database, with the ingest checkpoints and the view refresh state
+def mongo_ingest_setup(data_dir):
+    from pymongo import MongoClient
+    uri, database = mongo_target()
+    client = MongoClient(uri)
+    try:
+        client.drop_database(database)
+    finally:
+        client.close()
+    return 0
+
+
+# The MongoDB script reads the news file from its working directory and its database from MONGO_URI and MONGO_DATABASE
+def mongo_ingest(data_dir):
+    uri, database = mongo_target()
+    script = os.path.join(REPO_DIR, "Exercise 3", "MongoDB Creation DB and Insert.py")
+    subprocess.run([sys.executable, script], cwd=data_dir, check=True,
+                   env=dict(os.environ, MONGO_URI=uri, MONGO_DATABASE=database))
+    return count_lines(os.path.join(data_dir, "News_Category_Dataset_v3.json"))
+
+
+# Every stage in run order: its function, arguments, an optional untimed setup, and when it is skipped
+STAGES = [
+    {'name': "bronze_to_silver:iowa", 'run': bronze_to_silver, 'args': ('iowa',)},
+    {'name': "bronze_to_silver:amazon", 'run': bronze_to_silver, 'args': ('amazon',)},
+    {'name': "bronze_to_silver:swiggy", 'run': bronze_to_silver, 'args': ('swiggy',)},
+    {'name': "silver_to_gold:full", 'run': gold_full},
+    {'name': "silver_to_gold:out_of_core", 'run': gold_out_of_core},
+    {'name': "silver_to_gold:incremental", 'run': gold_incremental, 'setup': gold_incremental_setup},
+    {'name': "silver_to_gold:top_k", 'run': top_k},
+    {'name': "mysql:etl", 'run': mysql_etl, 'setup': mysql_etl_setup, 'requires': 'BENCH_MYSQL_HOST'},
+    {'name': "mongodb:ingest", 'run': mongo_ingest, 'setup': mongo_ingest_setup, 'requires': 'BENCH_MONGO'},
+]
+
+
+# Run one stage function and measure it, called inside a fresh process
+def measure(function, data_dir, args):
+    start = time.perf_counter()
+    rows = function(data_dir, *args)
+    duration = time.perf_counter() - start
+    return {
+        'rows': rows,
+        'duration': duration,
+        'rows_per_second': rows / duration if duration > 0 else 0.0,
+        # Includes the processes the stage waited for (the MongoDB script)
+        'peak_rss_mb': peak_rss_mb(include_children=True),
+    }
+
+
+def in_fresh_process(function, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(function, *args).result()
+
+
+# Run the stages at one scale factor, keeping the fastest of `repeat` runs of each stage
+def run_scale(scale, data_dir, stages, repeat=1, seed=0):
+    start = time.perf_counter()
+    generate_all(data_dir, scale, seed)
+    print(f"Scale {scale}: synthetic data generated in {time.perf_counter() - start:.2f}s under {data_dir}")
+
+    results = []
+    for stage in stages:
+        result = {'stage': stage['name'], 'scale': scale}
+        if stage.get('requires') and not os.environ.get(stage['requires']):
+            result['skipped'] = f"{stage['requires']} is not set"
+            print(f"  {stage['name']:<28} skipped, {result['skipped']}")
+            results.append(result)
+            continue
+
+        runs = []
+        for _ in range(repeat):
+            if stage.get('setup'):
+                in_fresh_process(measure, stage['setup'], data_dir, ())
+            runs.append(in_fresh_process(measure, stage['run'], data_dir, stage.get('args', ())))
+        result.update(min(runs, key=lambda run: run['duration']))
+        result['peak_rss_mb'] = max(run['peak_rss_mb'] for run in runs)
+        print(f"  {stage['name']:<28} {result['duration']:>8.2f}s {result['rows']:>10} rows "
+              f"{result['rows_per_second']:>12.0f} rows/s {result['peak_rss_mb']:>8.1f} MB")
+        results.append(result)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+# Run the benchmark at every scale factor and save the results as JSON, named after the time and the commit
+def run_benchmarks(scales, stage_names=None, repeat=1, data_dir=None, keep_data=False, results_dir=RESULTS_DIR, seed=0):
+    stages = [stage for stage in STAGES if not stage_names or stage['name'] in stage_names or stage['name'].split(':')[0] in stage_names]
+    commit = git_commit()
+    started = datetime.now(timezone.utc)
+
+    results = []
+    for scale in scales:
+        scale_dir = os.path.join(data_dir, f"scale-{scale}") if data_dir else tempfile.mkdtemp(prefix=f"bench-{scale}-")
+        try:
+            results.extend(run_scale(scale, scale_dir, stages, repeat, seed))
+        finally:
+            if not keep_data:
+                shutil.rmtree(scale_dir, ignore_errors=True)
+
+    report = {
+        'commit': commit,
+        'started': started.isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'repeat': repeat,
+        'results': results,
+    }
+    os.makedirs(results_dir, exist_ok=True)
+    results_path = os.path.join(results_dir, f"{started:%Y%m%d-%H%M%S}-{commit}.json")
+    with open(results_path, 'w') as file:
+        json.dump(report, file, indent=2)
+    print("Results saved to", results_path)
+    return results_path
+
+
+# Print the change in duration and peak memory of every stage between two result files
+def compare(old_path, new_path):
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    old_results = {(result['stage'], result['scale']): result for result in old['results'] if 'skipped' not in result}
+
+    print(f"{old['commit']} -> {new['commit']}")
+    print(f"{'Stage':<28} {'Scale':>6} {'Duration':>10} {'Change':>8} {'Peak RSS':>10} {'Change':>8}")
+    for result in new['results']:
+        before = old_results.get((result['stage'], result['scale']))
+        if 'skipped' in result or before is None:
+            continue
+        duration_change = (result['duration'] / before['duration'] - 1) * 100 if before['duration'] > 0 else 0.0
+        memory_change = (result['peak_rss_mb'] / before['peak_rss_mb'] - 1) * 100 if before['peak_rss_mb'] > 0 else 0.0
+        print(f"{result['stage']:<28} {result['scale']:>6} {result['duration']:>9.2f}s {duration_change:>+7.1f}% "
+              f"{result['peak_rss_mb']:>7.1f} MB {memory_change:>+7.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic data")
+    parser.add_argument('--scales', type=float, nargs='+', default=[0.1, 1.0], help="scale factors, 1 is the base row count of generate_data.py")
+    parser.add_argument('--stages', nargs='+', help="stage names or prefixes (e.g. silver_to_gold), all by default")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per stage, the fastest is kept")
+    parser.add_argument('--data-dir', help="where the synthetic data is written, a temporary folder by default")
+    parser.add_argument('--keep-data', action='store_true', help="keep the synthetic data after the run")
+    parser.add_argument('--results-dir', default=RESULTS_DIR)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two result files instead of running")
+    arguments = parser.parse_args()
+
+    if arguments.compare:
+        compare(*arguments.compare)
+    else:
+        run_benchmarks(arguments.scales, arguments.stages, arguments.repeat, arguments.data_dir,
+                       arguments.keep_data, arguments.results_dir, arguments.seed)
@@ -0,0 +1,224 @@
+import cProfile
+import fnmatch
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+# Lightweight per-stage instrumentation shared by the exercises.
+#
+# A stage is wrapped in a span:
+#
+#   with span("mysql.from_csv_to_raw") as stage:
+#       ...
+#       stage.rows_in = rows_read
+#       stage.rows_out = rows_inserted
+#       stage.bytes_read = os.path.getsize(csv_file_path)
+#
+# Every span records its duration, the rows and bytes the stage reports, the peak resident memory of the
+# process when it ends and how much the stage raised that peak. Finished spans are written as JSON lines.
+#
+# PIPELINE_METRICS turns it on: a file path the spans are appended to, or '-' for stderr.
+# When it is not set span() hands out a shared do-nothing span, so the wrapped code pays one function call.
+# PIPELINE_PROFILE names the spans to run under cProfile, comma separated, shell patterns allowed
+# (PIPELINE_PROFILE=gold.groupby or PIPELINE_PROFILE=gold.build.*,mysql.from_stage_to_hist), wherever they nest.
+# The profile of the slowest run of each span of the process is saved as <span>.prof in PIPELINE_PROFILE_DIR
+# (the working directory by default), readable with python -m pstats. Only one profiler can be active at a
+# time (Python 3.12+ raises otherwise): a named span that opens while another one is profiled, nested in it or
+# in another thread, is not profiled. Profiling works with PIPELINE_METRICS unset too.
+# All are read once, when the module is imported.
+METRICS_ENV = "PIPELINE_METRICS"
+PROFILE_ENV = "PIPELINE_PROFILE"
+PROFILE_DIR_ENV = "PIPELINE_PROFILE_DIR"
+METRICS_TARGET = os.environ.get(METRICS_ENV)
+PROFILE_SPANS = [pattern.strip() for pattern in os.environ.get(PROFILE_ENV, '').split(',') if pattern.strip()]
+PROFILE_DIR = os.environ.get(PROFILE_DIR_ENV, '.')
+
+# Identifies the spans of one run of a script in a shared metrics file
+RUN_ID = uuid.uuid4().hex[:12]
+
+_local = threading.local()
+_lock = threading.Lock()
+# Duration of the slowest profiled run of every span name, and whether a profiler is running in the process
+_slowest_profiled = {}
+_profiling = False
+
+
+# Peak resident memory of this process in MB; with include_children, the largest of this process and of
+# the child processes it waited for (a pipeline script run through subprocess)
+def peak_rss_mb(include_children=False):
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if include_children:
+            peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        # Windows has no resource module, ask psutil for the peak working set instead (children not included)
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+
+
+# Size in bytes of a file, or None when it does not exist (handy for bytes_read and bytes_written)
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+class Span:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.rows_in = None
+        self.rows_out = None
+        self.bytes_read = None
+        self.bytes_written = None
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+
+        self.profiler = _start_profiler() if _profiled(self.name) else None
+
+        self.started = datetime.now(timezone.utc)
+        self.peak_before = peak_rss_mb()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self.start
+        if self.profiler is not None:
+            _stop_profiler(self.profiler, self.name, duration)
+        _stack().pop()
+        if not METRICS_TARGET:
+            return False
+
+        peak = peak_rss_mb()
+        record = {
+            'run_id': RUN_ID,
+            'span': self.name,
+            'parent': self.parent,
+            'started': self.started.isoformat(),
+            'duration_s': round(duration, 6),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'peak_rss_mb': round(peak, 1),
+            'peak_rss_growth_mb': round(peak - self.peak_before, 1),
+            'status': 'ok' if exc_type is None else 'error',
+        }
+        if exc_type is not None:
+            record['error'] = f"{exc_type.__name__}: {exc}"
+        record.update(self.fields)
+        _emit(record)
+        return False
+
+
+# Stand-in returned while instrumentation is off: attribute writes are dropped, nothing is measured
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+# Wrap a stage: with span("gold.top_reviewers", keys="UserId") as stage: ...
+# Extra keyword arguments are added to the emitted record as they are.
+def span(name, **fields):
+    if not METRICS_TARGET and not _profiled(name):
+        return _NULL_SPAN
+    return Span(name, fields)
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _emit(record):
+    line = json.dumps(record, default=str)
+    with _lock:
+        if METRICS_TARGET == '-':
+            print(line, file=sys.stderr)
+        else:
+            with open(METRICS_TARGET, 'a') as file:
+                file.write(line + "\n")
+
+
+# True when PIPELINE_PROFILE names the span
+def _profiled(name):
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in PROFILE_SPANS)
+
+
+# A running profiler, or None while another span of the process is being profiled
+def _start_profiler():
+    global _profiling
+    with _lock:
+        if _profiling:
+            return None
+        _profiling = True
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiling tool (a debugger, an outer cProfile run) is active
+        with _lock:
+            _profiling = False
+        return None
+    return profiler
+
+
+# Stop the profiler and save its profile when it is the slowest run of its span so far in this process
+def _stop_profiler(profiler, name, duration):
+    global _profiling
+    profiler.disable()
+    with _lock:
+        _profiling = False
+        if duration > _slowest_profiled.get(name, 0.0):
+            _slowest_profiled[name] = duration
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}.prof"))
+
+
+# Fields every span record has, the others are the keyword arguments given to span()
+RECORD_FIELDS = ('run_id', 'span', 'parent', 'started', 'duration_s', 'rows_in', 'rows_out', 'bytes_read',
+                 'bytes_written', 'peak_rss_mb', 'peak_rss_growth_mb', 'status', 'error')
+
+
+# Print the spans of one run in a metrics file (the last run by default), slowest first
+def summarize(path, run_id=None):
+    with open(path) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    if run_id is None and records:
+        run_id = records[-1]['run_id']
+    records = [record for record in records if record['run_id'] == run_id]
+
+    print(f"Run {run_id}")
+    print(f"{'Span':<60} {'Parent':<30} {'Duration':>10} {'Rows in':>10} {'Rows out':>10} {'Peak RSS':>10}")
+    for record in sorted(records, key=lambda record: -record['duration_s']):
+        rows_in = record['rows_in'] if record['rows_in'] is not None else '-'
+        rows_out = record['rows_out'] if record['rows_out'] is not None else '-'
+        extra = ', '.join(f"{key}={value}" for key, value in record.items() if key not in RECORD_FIELDS)
+        label = f"{record['span']} ({extra})" if extra else record['span']
+        print(f"{label:<60} {record['parent'] or '-':<30} {record['duration_s']:>9.3f}s {rows_in:>10} "
+              f"{rows_out:>10} {record['peak_rss_mb']:>7.1f} MB")
+
+
+if __name__ == "__main__":
+    # python instrumentation.py <metrics.jsonl> [run_id]
+    summarize(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)